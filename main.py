@@ -1,9 +1,12 @@
 import asyncio
 import logging
-from src.core.loader import setup_system, start_bot, dp, scheduler # Потрібен dp та scheduler
+from src.core.logger import setup_logging, shutdown_logging
+from src.core.loader import setup_system, start_bot, dp, scheduler, leader, shutdown_import_pool # Потрібен dp та scheduler
+from src.core.loop_watchdog import loop_watchdog
 
-# Налаштування логування (дуже корисно!)
-logging.basicConfig(level=logging.INFO)
+# Налаштування логування: JSON-рядки через чергу, щоб не блокувати event loop
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 async def main():
@@ -20,11 +23,18 @@ if __name__ == '__main__':
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         # Додаткові кроки для коректного завершення роботи
+        # Сторож event loop більше не потрібен
+        loop_watchdog.stop()
         # 1. Зупинка планувальника
         if scheduler.running:
             scheduler.shutdown()
+        # Зупиняємо процес імпорту (незавершені завдання скасовуються)
+        shutdown_import_pool()
+        # Звільняємо лідерство, щоб інша репліка підхопила завдання без очікування
+        leader.release()
         # 2. Очищення сховища FSM та закриття сесій
         asyncio.run(dp.storage.close())
         asyncio.run(dp.storage.wait_closed())
 
-        print("🛑 Бот та планувальник зупинено. Сховище закрито.")
\ No newline at end of file
+        logger.info("🛑 Бот та планувальник зупинено. Сховище закрито.")
+        shutdown_logging()
\ No newline at end of file
@@ -18,13 +18,95 @@ class Settings(BaseSettings):
     # --- 1. Telegram та Bot Core ---
     BOT_TOKEN: str
 
+    # Чат адміністратора: сюди надсилаються звіти, лише тут доступні адмін-команди
+    ADMIN_CHAT_ID: int | None = None
+
+    # Кеш зареєстрованих користувачів (telegram_id -> ПІБ): розмір та час життя запису, с
+    REGISTRATION_CACHE_SIZE: int = 10000
+    REGISTRATION_CACHE_TTL: int = 600
+
+    # Обмеження частоти запитів на користувача (token bucket): швидкість (подій/с) і запас (burst)
+    THROTTLE_COMMON_RATE: float = 1.0
+    THROTTLE_COMMON_BURST: int = 3
+    THROTTLE_REGISTRATION_RATE: float = 0.2  # /start та спроби введення ПІНа
+    THROTTLE_REGISTRATION_BURST: int = 5
+    THROTTLE_TESTING_RATE: float = 2.0  # натискання кнопок відповідей
+    THROTTLE_TESTING_BURST: int = 5
+
     # --- 2. Налаштування Бази Даних ---
     DATABASE_URL: str
+    # Необов'язкова репліка для важких читань (звіти, експорт, аналітика). Порожньо — все йде в основну БД.
+    # Користувачу репліки потрібна роль pg_read_all_stats (стан реплікації з pg_stat_wal_receiver).
+    DATABASE_REPLICA_URL: str | None = None
+    # Максимальне відставання репліки (секунди), за якого на неї ще можна відправляти читання
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    # Скільки секунд може минути від останнього повідомлення основної БД репліці (дані або keepalive,
+    # який основна БД шле при простої раз на wal_sender_timeout/2), поки реплікація вважається живою
+    REPLICA_RECEIPT_TIMEOUT_SECONDS: float = 60.0
+
+    # FSM-сховище в пам'яті: час життя запису (с від останнього звернення) за станом та ліміт записів.
+    # Витіснені користувачі в main_menu відновлюються з БД при наступному повідомленні.
+    FSM_AWAITING_PIN_TTL: int = 86400
+    FSM_MAIN_MENU_TTL: int = 3600
+    FSM_IN_TEST_TTL: int = 86400  # покинутий тест (з questions_list) звільняє пам'ять через добу
+    FSM_DEFAULT_TTL: int = 86400
+    FSM_MAX_ENTRIES: int = 20000
+    # Як часто прибирати прострочені записи, хв
+    FSM_SWEEP_MINUTES: int = 10
 
     # --- 3. Налаштування Планувальника (Scheduling) ---
     # 🕒 ЗМІНЕНО: Час розсилки тепер встановлено для київської часової зони.
     SCHEDULE_TIME: time = time(hour=16, minute=1, second=0, tzinfo=ZoneInfo("Europe/Kiev"))
 
+    # Режим "редагування на місці": після відповіді те саме повідомлення стає наступним питанням
+    # (1 виклик Bot API на питання замість 2). Історія відповідей у чаті при цьому не зберігається.
+    QUESTION_FLOW_EDIT_IN_PLACE: bool = False
+
+    # Компактне зберігання відповідей: нові сесії пишуть відповіді в масиви на test_sessions
+    # (одне оновлення рядка на відповідь) замість окремого рядка user_answers на кожне питання.
+    PACKED_ANSWERS: bool = False
+
+    # За скільки хвилин до SCHEDULE_TIME готувати когорту (сесії, питання, перше повідомлення).
+    # Має бути пізніше за імпорт стажерів (15:59), інакше нові стажери потраплять лише в дозапуск.
+    PREWARM_LEAD_MINUTES: int = 1
+
+    # Скільки перших питань когорти надсилаємо паралельно в момент запуску
+    PREWARM_SEND_CONCURRENCY: int = 10
+
+    # Ключ advisory-lock PostgreSQL для вибору лідера планувальника між репліками
+    SCHEDULER_LOCK_KEY: int = 730126
+    # Як часто (у секундах) репліки перевіряють/захоплюють лідерство
+    LEADER_CHECK_SECONDS: int = 15
+
+    # Завершені сесії, старші за стільки днів, щоночі переносяться в архівні таблиці
+    RETENTION_DAYS: int = 180
+    # Скільки сесій архівуємо за одну транзакцію
+    RETENTION_BATCH_SIZE: int = 1000
+
+    # --- Логування ---
+    # Мінімальний рівень логів. SAMPLED (15) — часті події (кожна відповідь), що проходять вибірково
+    LOG_LEVEL: str = "SAMPLED"
+    # Формат виводу: "json" (JSON-рядки для збору логів) або "text"
+    LOG_FORMAT: str = "json"
+    # Частка подій рівня SAMPLED, яка потрапляє в лог (0.0–1.0)
+    LOG_SAMPLE_RATE: float = 0.1
+
+    # --- Профілювання на вимогу (див. core/profiling.py, адмін-команда /profile) ---
+    # Увімкнути профілювання на стільки секунд одразу після старту (0 — вимкнено)
+    PROFILE_ON_START_SECONDS: int = 0
+    # Разом із профілюванням на старті збирати топ алокацій (tracemalloc)
+    PROFILE_ON_START_MEMORY: bool = False
+    # Інтервал знімання стеків, мс
+    PROFILE_SAMPLE_INTERVAL_MS: int = 5
+    # Куди зберігаються профілі
+    PROFILE_DIR: str = "data/profiles"
+
+    # --- Сторож event loop (див. core/loop_watchdog.py) ---
+    # Блокування loop довше за поріг логується зі стеком і рахується в метриках (0 — вимкнено)
+    LOOP_WATCHDOG_THRESHOLD_MS: int = 250
+    # Як часто сторож перевіряє лаг loop, мс
+    LOOP_WATCHDOG_INTERVAL_MS: int = 100
+
     # --- 4. Налаштування Google Sheets/Drive ---
     # 🔒 ЗМІНЕНО: Тепер завантажуємо вміст credentials.json з цієї змінної, а не з файлу.
     # У вашому .env файлі ця змінна має містити весь JSON у вигляді рядка.
@@ -39,6 +121,13 @@ class Settings(BaseSettings):
     # ID Google DOCS, звідки імпортуємо питання
     QUESTION_DOC_ID: str
 
+    # Режим дайджесту: раз на стільки хвилин адміністратор отримує одну таблицю балів
+    # і файл з повними звітами замість повідомлення на кожну сесію. 0 — вимкнено.
+    REPORT_DIGEST_MINUTES: int = 0
+
+    # Скільки відрендерених звітів завершених сесій тримати в пам'яті (для /report і дайджестів)
+    REPORT_CACHE_SIZE: int = 500
+
     # ID Google Doc для запису звітів
     REPORT_DOC_ID: str = "1onNj_UAcsNv6xioHBv8HowETMlmll5M8IOY4Nb_2pxE"
 
@@ -46,6 +135,12 @@ class Settings(BaseSettings):
     # Шлях до директорії, де будемо зберігати фотографії
     PHOTO_DIR: str = "data/question_photos"
 
+    # Шлях до директорії, куди зберігаються файли експорту результатів
+    EXPORT_DIR: str = "data/exports"
+
+    # Локальний знімок банку питань (Arrow IPC): старт без очікування Google Docs
+    QUESTION_SNAPSHOT_PATH: str = "data/question_bank.arrow"
+
 
 # Створюємо єдиний екземпляр налаштувань, який буде використовуватися у всьому проєкті.
 settings = Settings()
@@ -62,4 +157,10 @@ absolute_photo_dir = BASE_DIR / settings.PHOTO_DIR
 
 # Оновлюємо значення в налаштуваннях та одразу створюємо директорію, якщо її немає.
 settings.PHOTO_DIR = str(absolute_photo_dir)
-absolute_photo_dir.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
+absolute_photo_dir.mkdir(parents=True, exist_ok=True)
+
+absolute_export_dir = BASE_DIR / settings.EXPORT_DIR
+settings.EXPORT_DIR = str(absolute_export_dir)
+absolute_export_dir.mkdir(parents=True, exist_ok=True)
+settings.QUESTION_SNAPSHOT_PATH = str(BASE_DIR / settings.QUESTION_SNAPSHOT_PATH)
+settings.PROFILE_DIR = str(BASE_DIR / settings.PROFILE_DIR)
@@ -0,0 +1,130 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Record:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    expires_at: float = 0.0
+
+
+class BoundedMemoryStorage(BaseStorage):
+    """
+    FSM-сховище в пам'яті з обмеженим розміром (заміна MemoryStorage).
+
+    - Кожен запис живе TTL секунд від останнього звернення; TTL залежить від стану
+      (state_ttls, напр. окремо для awaiting_pin, main_menu, in_test), інакше default_ttl.
+    - Записів не більше max_entries: при переповненні витісняється найдавніше використаний (LRU).
+    - Запис без стану та даних (після state.clear()) не зберігається взагалі.
+    - Якщо запису немає (витіснено або бот перезапущено), get_state питає restore_state(key):
+      так користувачі в main_menu відновлюються з БД лише тоді, коли знову пишуть боту.
+
+    Усі методи викликаються з потоку event loop, тому блокування не потрібні.
+    """
+
+    def __init__(self, state_ttls: Mapping[str, float], default_ttl: float, max_entries: int,
+                 restore_state: Callable[[StorageKey], str | None] | None = None):
+        self._state_ttls = dict(state_ttls)
+        self._default_ttl = default_ttl
+        self._max_entries = max_entries
+        self._restore_state = restore_state
+        # Порядок — від найдавніше до найнещодавніше використаного
+        self._records: OrderedDict[StorageKey, _Record] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def _get(self, key: StorageKey) -> _Record | None:
+        record = self._records.get(key)
+        if record is None:
+            return None
+        if record.expires_at <= time.monotonic():
+            del self._records[key]
+            metrics.inc('fsm_evicted', reason='ttl', state=record.state or 'none')
+            return None
+        return record
+
+    def _insert(self, key: StorageKey) -> _Record:
+        record = self._records[key] = _Record()
+        while len(self._records) > self._max_entries:
+            _, evicted = self._records.popitem(last=False)
+            metrics.inc('fsm_evicted', reason='lru', state=evicted.state or 'none')
+        return record
+
+    def _touch(self, key: StorageKey, record: _Record):
+        """Продовжує життя запису (TTL за поточним станом) або видаляє порожній запис."""
+        if record.state is None and not record.data:
+            self._records.pop(key, None)
+            return
+        record.expires_at = time.monotonic() + self._state_ttls.get(record.state, self._default_ttl)
+        self._records.move_to_end(key)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state_name = state.state if isinstance(state, State) else state
+        record = self._get(key)
+        if record is None:
+            if state_name is None:
+                return
+            record = self._insert(key)
+        record.state = state_name
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = self._get(key)
+        if record is not None:
+            self._touch(key, record)
+            return record.state
+        if self._restore_state is None:
+            return None
+
+        state_name = self._restore_state(key)
+        if state_name is not None:
+            record = self._insert(key)
+            record.state = state_name
+            self._touch(key, record)
+            metrics.inc('fsm_restored', state=state_name)
+        return state_name
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = self._get(key)
+        if record is None:
+            if not data:
+                return
+            record = self._insert(key)
+        record.data = dict(data)
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        record = self._get(key)
+        if record is None:
+            return {}
+        self._touch(key, record)
+        return record.data.copy()
+
+    async def evict_expired(self) -> int:
+        """
+        Видаляє всі прострочені записи (зокрема покинуті тести, до яких ніхто не повертається).
+        Асинхронна, щоб планувальник виконував її в event loop, а не в потоці.
+        """
+        now = time.monotonic()
+        expired = [key for key, record in self._records.items() if record.expires_at <= now]
+        for key in expired:
+            record = self._records.pop(key)
+            metrics.inc('fsm_evicted', reason='ttl', state=record.state or 'none')
+        if expired:
+            logger.info(f"[FSM] Видалено {len(expired)} прострочених записів, залишилось {len(self._records)}.")
+        return len(expired)
+
+    async def close(self) -> None:
+        self._records.clear()
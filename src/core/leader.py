@@ -0,0 +1,104 @@
+import logging
+import functools
+import inspect
+from typing import Callable
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, Connection
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerLeaderElection:
+    """
+    Вибір лідера для планувальника між кількома репліками бота.
+
+    Лідер тримає сесійний advisory-lock PostgreSQL на окремому з'єднанні.
+    Лише лідер виконує cron-завдання; решта реплік періодично намагаються
+    захопити замок. Якщо процес лідера падає, PostgreSQL закриває його
+    з'єднання і звільняє замок — його підхоплює наступна репліка.
+    """
+
+    def __init__(self, engine: Engine, lock_key: int):
+        self.engine = engine
+        self.lock_key = lock_key
+        self._conn: Connection | None = None
+        self.is_leader = False
+
+    def try_acquire(self) -> bool:
+        """
+        Перевіряє/захоплює лідерство. Викликається при старті та періодично планувальником.
+        """
+        if self.is_leader:
+            # Лідер перевіряє, що його з'єднання (а з ним і замок) ще живе
+            try:
+                self._conn.execute(text("SELECT 1"))
+                self._conn.commit()
+                return True
+            except Exception as e:
+                logger.error(f"[Leader] 🔴 Втрачено з'єднання із замком, лідерство знято: {e}")
+                self._drop_connection()
+
+        try:
+            conn = self.engine.connect()
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {'key': self.lock_key}
+            ).scalar()
+            # Сесійний advisory-lock переживає транзакцію, тому одразу її закриваємо
+            conn.commit()
+        except Exception as e:
+            logger.error(f"[Leader] 🔴 Помилка спроби захоплення лідерства: {e}")
+            return False
+
+        if acquired:
+            self._conn = conn
+            self.is_leader = True
+            logger.info(f"[Leader] ✅ Ця репліка стала лідером планувальника (lock {self.lock_key}).")
+        else:
+            conn.close()
+        return self.is_leader
+
+    def release(self):
+        """Добровільно звільняє лідерство (при зупинці бота)."""
+        if not self.is_leader:
+            return
+        try:
+            self._conn.execute(text("SELECT pg_advisory_unlock(:key)"), {'key': self.lock_key})
+            self._conn.commit()
+        except Exception as e:
+            logger.warning(f"[Leader] ⚠️ Не вдалося звільнити замок: {e}")
+        self._drop_connection()
+
+    def _drop_connection(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self.is_leader = False
+
+    def leader_only(self, job: Callable) -> Callable:
+        """
+        Обгортає завдання планувальника так, щоб воно виконувалося лише на лідері.
+        Зберігає тип завдання: async-функції лишаються async (виконуються в event loop),
+        sync — sync (виконуються в пулі потоків планувальника).
+        """
+        if inspect.iscoroutinefunction(job):
+            @functools.wraps(job)
+            async def async_wrapper(*args, **kwargs):
+                if not self.is_leader:
+                    logger.info(f"[Leader] Пропуск '{job.__name__}': ця репліка не є лідером.")
+                    return None
+                return await job(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(job)
+        def sync_wrapper(*args, **kwargs):
+            if not self.is_leader:
+                logger.info(f"[Leader] Пропуск '{job.__name__}': ця репліка не є лідером.")
+                return None
+            return job(*args, **kwargs)
+
+        return sync_wrapper
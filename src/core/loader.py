@@ -1,17 +1,59 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import StorageKey
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from aiogram.client.default import DefaultBotProperties
 from zoneinfo import ZoneInfo  # 👈 1. Імпорт для роботи з часовими зонами
+from datetime import datetime, date, timedelta
 
 from .config import settings
-from ..database.session import init_db, SessionLocal
+from .metrics import metrics
+from .fsm_storage import BoundedMemoryStorage
+from .states import RegistrationStates, TestingStates
+from .leader import SchedulerLeaderElection
+from .profiling import profiler, profiled
+from .loop_watchdog import loop_watchdog
+from ..database.session import init_db, engine, SessionLocal
 from ..handlers.registration import registration_router
 from ..handlers.common import common_router
 from ..handlers.testing import testing_router
+from ..handlers.admin import admin_router
+from ..middlewares.throttling import ThrottlingMiddleware
+from ..middlewares.update_lanes import UserLaneMiddleware
 from ..services.testing_service import TestingSchedulerWrapper
-from ..utils.google_doc_importer import GoogleDocsImporter
-from ..utils.google_sheet_importer import import_interns_data
+from ..services.registration_service import invalidate_registration_cache, RegistrationService, RegistrationError
+from ..services.reporting_service import flush_report_digest
+from ..utils.bank_snapshot import restore_bank_from_snapshot
+from ..workers import import_worker
+
+logger = logging.getLogger(__name__)
+
+
+def restore_registered_state(key: StorageKey) -> str | None:
+    """
+    Стан для користувача, чий запис витіснено з FSM-сховища (або після перезапуску):
+    зареєстровані стажери повертаються в main_menu. ПІБ береться з кешу реєстрацій,
+    тож до БД звертаємось лише при промаху кешу.
+    """
+    if key.chat_id != key.user_id:
+        # Групові чати (напр. адмінський) не мають стану реєстрації
+        return None
+    try:
+        with SessionLocal() as db:
+            RegistrationService(db).get_intern_name_by_telegram_id(key.user_id)
+    except RegistrationError:
+        return None
+    except Exception as e:
+        logger.error(f"[FSM] Не вдалося відновити стан користувача {key.user_id}: {e}")
+        return None
+    return RegistrationStates.main_menu.state
+
 
 # --- 1. Ініціалізація Основних Об'єктів ---
 
@@ -19,37 +61,141 @@ bot = Bot(
     token=settings.BOT_TOKEN,
     default=DefaultBotProperties(parse_mode="MarkdownV2")
 )
-storage = MemoryStorage()
+storage = BoundedMemoryStorage(
+    state_ttls={
+        RegistrationStates.awaiting_pin.state: settings.FSM_AWAITING_PIN_TTL,
+        RegistrationStates.main_menu.state: settings.FSM_MAIN_MENU_TTL,
+        TestingStates.in_test.state: settings.FSM_IN_TEST_TTL,
+    },
+    default_ttl=settings.FSM_DEFAULT_TTL,
+    max_entries=settings.FSM_MAX_ENTRIES,
+    restore_state=restore_registered_state,
+)
 dp = Dispatcher(storage=storage)
+# Оновлення одного користувача — строго послідовно, різних користувачів — паралельно
+dp.update.outer_middleware(UserLaneMiddleware())
 bot.storage = storage
 
 # 🕒 ЗМІНЕНО: Планувальник тепер налаштований на київську часову зону.
 scheduler = AsyncIOScheduler(timezone=ZoneInfo("Europe/Kiev"))
 testing_wrapper = TestingSchedulerWrapper(bot=bot)
+# Лише одна репліка (лідер) виконує cron-завдання
+leader = SchedulerLeaderElection(engine, settings.SCHEDULER_LOCK_KEY)
+# Пул процесів для імпорту та аналітики. "spawn" — дочірній процес не успадковує
+# з'єднання БД та event loop бота; процес створюється лише при першому завданні.
+# Доступ лише через get_import_pool(): аварійно завершений пул перестворюється.
+_import_pool: ProcessPoolExecutor | None = None
+_import_pool_lock = threading.Lock()
+# Посилання на фонові задачі, щоб їх не прибрав збирач сміття до завершення
+background_tasks: set[asyncio.Task] = set()
+
+
+def get_import_pool() -> ProcessPoolExecutor:
+    """Поточний пул процесів для важких завдань (створюється при першому зверненні)."""
+    global _import_pool
+    with _import_pool_lock:
+        if _import_pool is None:
+            _import_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return _import_pool
+
+
+def _discard_broken_import_pool(broken: ProcessPoolExecutor):
+    """Прибирає непридатний пул; наступний get_import_pool() створить новий."""
+    global _import_pool
+    with _import_pool_lock:
+        # Інше завдання могло вже замінити пул — тоді чіпати нічого не треба
+        if _import_pool is broken:
+            _import_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_import_pool():
+    """Зупиняє пул процесів (незавершені завдання скасовуються)."""
+    global _import_pool
+    with _import_pool_lock:
+        pool, _import_pool = _import_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 # --- ДОПОМІЖНІ ФУНКЦІЇ-ОБГОРТКИ ДЛЯ ПЛАНУВАЛЬНИКА ---
 
-def scheduled_import_interns():
+async def run_in_import_pool(job: Callable):
+    """
+    Виконує важке завдання (імпорт, аналітика) в окремому процесі та чекає завершення,
+    не блокуючи event loop і не конкуруючи з хендлерами за GIL.
+    Якщо дочірній процес аварійно завершився (OOM kill, segfault у pyarrow/Pillow), пул
+    перестворюється, а завдання повторюється один раз; повторна аварія піднімає помилку.
+    """
+    loop = asyncio.get_running_loop()
+    for attempt in (1, 2):
+        pool = get_import_pool()
+        try:
+            return await loop.run_in_executor(pool, job)
+        except BrokenProcessPool:
+            _discard_broken_import_pool(pool)
+            metrics.inc('import_pool_broken', job=job.__name__)
+            if attempt == 2:
+                raise
+            logger.error(f"[Pool] Процес пулу аварійно завершився під час '{job.__name__}'. "
+                         f"Пул перестворено, повторна спроба.")
+
+
+async def startup_import():
+    """Первинний імпорт стажерів і питань під час старту (виконується у фоні)."""
+    logger.info("[DB] Спроба первинного імпорту даних...")
+    try:
+        await run_in_import_pool(import_worker.run_intern_import)
+        invalidate_registration_cache()
+        logger.info("[DB] Дані стажерів успішно імпортовані.")
+        await run_in_import_pool(import_worker.run_question_import)
+        logger.info("[DB] Питання успішно імпортовані.")
+    except Exception as e:
+        logger.error(f"[DB] 🔴 ПОМИЛКА ПЕРВИННОГО ІМПОРТУ: {e}")
+
+
+@profiled()
+async def scheduled_import_interns():
     """Обгортка для запланованого імпорту стажерів з Google Sheets."""
-    print("🔄 Запланований імпорт: Оновлення даних стажерів...")
+    logger.info("🔄 Запланований імпорт: Оновлення даних стажерів...")
     try:
-        import_interns_data(SessionLocal)
-        print("   [Scheduled Import] Дані стажерів успішно оновлені.")
+        await run_in_import_pool(import_worker.run_intern_import)
+        # Імпорт відбувся в іншому процесі — кеш цього процесу скидаємо тут
+        invalidate_registration_cache()
+        logger.info("[Scheduled Import] Дані стажерів успішно оновлені.")
     except Exception as e:
-        print(f"   [Scheduled Import] 🔴 ПОМИЛКА ІМПОРТУ СТАЖЕРІВ: {e}")
+        logger.error(f"[Scheduled Import] 🔴 ПОМИЛКА ІМПОРТУ СТАЖЕРІВ: {e}")
 
 
-def scheduled_import_questions():
+@profiled()
+async def scheduled_import_questions():
     """Обгортка для запланованого імпорту питань з Google Docs."""
-    print("🔄 Запланований імпорт: Оновлення питань з Google Docs...")
+    logger.info("🔄 Запланований імпорт: Оновлення питань з Google Docs...")
     try:
-        docs_importer = GoogleDocsImporter()
-        with SessionLocal() as db:
-            docs_importer.import_questions(db)
-        print("   [Scheduled Import] Питання успішно оновлені.")
+        await run_in_import_pool(import_worker.run_question_import)
+        logger.info("[Scheduled Import] Питання успішно оновлені.")
+    except Exception as e:
+        logger.error(f"[Scheduled Import] 🔴 ПОМИЛКА ІМПОРТУ ПИТАНЬ: {e}")
+
+
+@profiled()
+async def scheduled_item_analysis():
+    """Обгортка для нічного психометричного аналізу питань."""
+    logger.info("🔄 Запланований аналіз питань...")
+    try:
+        await run_in_import_pool(import_worker.run_item_analysis)
+    except Exception as e:
+        logger.error(f"[Scheduled Analytics] 🔴 ПОМИЛКА АНАЛІЗУ ПИТАНЬ: {e}")
+
+
+@profiled()
+async def scheduled_retention():
+    """Обгортка для нічної архівації старих сесій."""
+    logger.info("🔄 Запланована архівація сесій...")
+    try:
+        await run_in_import_pool(import_worker.run_retention)
     except Exception as e:
-        print(f"   [Scheduled Import] 🔴 ПОМИЛКА ІМПОРТУ ПИТАНЬ: {e}")
+        logger.error(f"[Scheduled Retention] 🔴 ПОМИЛКА АРХІВАЦІЇ СЕСІЙ: {e}")
 
 
 # -----------------------------------------------
@@ -61,66 +207,159 @@ async def setup_system():
     """
     Збирає всі компоненти системи, реєструє хендлери та ініціалізує БД.
     """
-    print("🚀 Запуск ініціалізації системи...")
+    logger.info("🚀 Запуск ініціалізації системи...")
 
     # 2.1. Ініціалізація Бази Даних
     init_db()
-    print("   [DB] База даних і таблиці ініціалізовані.")
+    logger.info("[DB] База даних і таблиці ініціалізовані.")
 
-    # 2.2. Первинний імпорт даних під час старту
-    print("   [DB] Спроба первинного імпорту даних...")
-    try:
-        import_interns_data(SessionLocal)
-        print("   [DB] Дані стажерів успішно імпортовані.")
-        docs_importer = GoogleDocsImporter()
-        with SessionLocal() as db:
-            docs_importer.import_questions(db)
-        print("   [DB] Питання успішно імпортовані.")
-    except Exception as e:
-        print(f"   [DB] 🔴 ПОМИЛКА ПЕРВИННОГО ІМПОРТУ: {e}")
+    # 2.2. Вибір лідера планувальника (актуально при кількох репліках)
+    leader.try_acquire()
+
+    # Сторож блокувань event loop (синхронні БД/Google-виклики всередині корутин)
+    loop_watchdog.start(asyncio.get_running_loop())
+
+    # Профілювання з моменту старту (вмикається змінною оточення)
+    if settings.PROFILE_ON_START_SECONDS > 0:
+        profiler.start(settings.PROFILE_ON_START_SECONDS, trace_memory=settings.PROFILE_ON_START_MEMORY)
+
+    # 2.3. Первинний імпорт даних під час старту (лише на лідері).
+    # Банк питань одразу береться з локального знімка (якщо в БД його немає), а свіжі дані
+    # з Google підтягуються у фоні — повільний чи недоступний Google не затримує старт.
+    if leader.is_leader:
+        try:
+            with SessionLocal() as db:
+                if restore_bank_from_snapshot(db):
+                    logger.info("[DB] Банк питань відновлено з локального знімка.")
+        except Exception as e:
+            logger.error(f"[DB] 🔴 Не вдалося відновити банк зі знімка: {e}")
+        startup_import_task = asyncio.create_task(startup_import())
+        background_tasks.add(startup_import_task)
+        startup_import_task.add_done_callback(background_tasks.discard)
+    else:
+        logger.info("[DB] Первинний імпорт пропущено: імпорт виконує репліка-лідер.")
 
-    # 2.3. Реєстрація Роутерів
+    # 2.4. Реєстрація Роутерів
+    # Обмеження частоти на користувача — до хендлерів, тобто до будь-якої роботи з БД
+    common_throttle = ThrottlingMiddleware('common', settings.THROTTLE_COMMON_RATE, settings.THROTTLE_COMMON_BURST)
+    common_router.message.middleware(common_throttle)
+
+    registration_throttle = ThrottlingMiddleware(
+        'registration', settings.THROTTLE_REGISTRATION_RATE, settings.THROTTLE_REGISTRATION_BURST)
+    registration_router.message.middleware(registration_throttle)
+
+    testing_throttle = ThrottlingMiddleware('testing', settings.THROTTLE_TESTING_RATE, settings.THROTTLE_TESTING_BURST)
+    testing_router.message.middleware(testing_throttle)
+    testing_router.callback_query.middleware(testing_throttle)
+
+    dp.include_router(admin_router)
     dp.include_router(common_router)
     dp.include_router(registration_router)
     dp.include_router(testing_router)
-    print("   [Handlers] Роутери підключені: common, registration, testing.")
+    logger.info("[Handlers] Роутери підключені: admin, common, registration, testing.")
+
+    # 2.5. Додавання запланованих завдань
+    # Кожне cron-завдання обгорнуте leader_only, тож виконується рівно на одній репліці.
 
-    # 2.4. Додавання запланованих завдань
+    # Періодична перевірка лідерства (failover, якщо лідер зник)
+    scheduler.add_job(
+        leader.try_acquire,
+        'interval',
+        seconds=settings.LEADER_CHECK_SECONDS,
+        id='scheduler_leader_election',
+        max_instances=1
+    )
 
     # Завдання для оновлення стажерів
     scheduler.add_job(
-        scheduled_import_interns,
+        leader.leader_only(scheduled_import_interns),
         'cron',
         hour=15,
         minute=59,
         id='google_sheets_update'
     )
-    print("   [Scheduler] Оновлення стажерів заплановано на 15:59 (за Києвом).")
+    logger.info("[Scheduler] Оновлення стажерів заплановано на 15:59 (за Києвом).")
 
     # Завдання для оновлення питань
     scheduler.add_job(
-        scheduled_import_questions,
+        leader.leader_only(scheduled_import_questions),
         'cron',
         hour=15,
         minute=0,
         id='google_docs_update'
     )
-    print("   [Scheduler] Оновлення питань заплановано на 15:00 (за Києвом).")
+    logger.info("[Scheduler] Оновлення питань заплановано на 15:00 (за Києвом).")
+
+    # Нічний аналіз питань (складність, дискримінація, KR-20)
+    scheduler.add_job(
+        leader.leader_only(scheduled_item_analysis),
+        'cron',
+        hour=3,
+        minute=0,
+        id='item_analysis'
+    )
+    logger.info("[Scheduler] Аналіз питань заплановано на 03:00 (за Києвом).")
+
+    # Нічна архівація завершених сесій, старших за RETENTION_DAYS
+    scheduler.add_job(
+        leader.leader_only(scheduled_retention),
+        'cron',
+        hour=3,
+        minute=30,
+        id='session_retention'
+    )
+    logger.info("[Scheduler] Архівація сесій запланована на 03:30 (за Києвом).")
+
+    # Завдання для попередньої підготовки когорти (сесії, питання, перше повідомлення)
+    prewarm_time = (
+        datetime.combine(date.today(), settings.SCHEDULE_TIME.replace(tzinfo=None))
+        - timedelta(minutes=settings.PREWARM_LEAD_MINUTES)
+    ).time()
+    scheduler.add_job(
+        leader.leader_only(testing_wrapper.prepare_scheduled_tests),
+        'cron',
+        hour=prewarm_time.hour,
+        minute=prewarm_time.minute,
+        id='prepare_final_tests'
+    )
+    logger.info(f"[Scheduler] Підготовка когорти запланована на {prewarm_time.strftime('%H:%M')} (за Києвом).")
 
     # Завдання для запуску тестів
     scheduler.add_job(
-        testing_wrapper.run_scheduled_tests,
+        leader.leader_only(testing_wrapper.run_scheduled_tests),
         'cron',
         hour=settings.SCHEDULE_TIME.hour,
         minute=settings.SCHEDULE_TIME.minute,
         id='run_final_tests'
     )
 
-    # 2.5. Запуск Планувальника
+    # Дайджест звітів адміністратору. Недоставлені звіти відстежуються в БД (report_sent_at),
+    # тому надсилає лише лідер, а звіти, не надіслані до зупинки, підуть у наступний дайджест.
+    if settings.REPORT_DIGEST_MINUTES > 0:
+        scheduler.add_job(
+            leader.leader_only(flush_report_digest),
+            'interval',
+            minutes=settings.REPORT_DIGEST_MINUTES,
+            args=[bot],
+            id='report_digest',
+            max_instances=1
+        )
+        logger.info(f"[Scheduler] Дайджест звітів кожні {settings.REPORT_DIGEST_MINUTES} хв.")
+
+    # Прибирання прострочених FSM-записів. Сховище в пам'яті кожної репліки, тому без leader_only.
+    scheduler.add_job(
+        storage.evict_expired,
+        'interval',
+        minutes=settings.FSM_SWEEP_MINUTES,
+        id='fsm_sweep',
+        max_instances=1
+    )
+
+    # 2.6. Запуск Планувальника
     scheduler.start()
-    print(f"   [Scheduler] Планувальник запущено. Тести заплановано на {settings.SCHEDULE_TIME.strftime('%H:%M')} (за Києвом).")
+    logger.info(f"[Scheduler] Планувальник запущено. Тести заплановано на {settings.SCHEDULE_TIME.strftime('%H:%M')} (за Києвом).")
 
-    print("✅ Ініціалізація завершена.")
+    logger.info("✅ Ініціалізація завершена.")
 
 
 # --- 3. Функція Запуску ---
@@ -0,0 +1,89 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+from .config import settings
+
+# Рівень для частих подій (кожна відповідь тощо): проходить лише частка LOG_SAMPLE_RATE
+SAMPLED = 15
+logging.addLevelName(SAMPLED, "SAMPLED")
+
+# Поля з extra=..., які виводяться у структурованому записі
+CONTEXT_FIELDS = ('session_id', 'user_id', 'question_id', 'job', 'duration_ms')
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Форматує запис як один JSON-рядок (зручно для парсингу та збору логів)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускає лише частку записів рівня SAMPLED; інші рівні — без змін."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != SAMPLED:
+            return True
+        return random.random() < self.rate
+
+
+def setup_logging():
+    """
+    Налаштовує логування через чергу: обробники викликають лише put_nowait()
+    (без блокуючого I/O в event loop), а запис у stdout робить окремий потік QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+
+    output_handler = logging.StreamHandler()
+    if settings.LOG_FORMAT == 'json':
+        output_handler.setFormatter(JsonLinesFormatter())
+    else:
+        output_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Фільтр на стороні черги: відкинуті записи навіть не потрапляють у чергу
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(queue_handler)
+    root.setLevel(settings.LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, output_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Зупиняє фоновий потік логування, дописавши всі записи з черги."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from .config import settings
+from .metrics import metrics
+from .profiling import profiler
+
+logger = logging.getLogger(__name__)
+
+# Кадри з цієї директорії вважаються "нашим" кодом при атрибуції блокування
+PROJECT_SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Скільки останніх кадрів стеку потрапляє в лог
+STACK_LIMIT = 30
+
+
+class LoopWatchdog:
+    """
+    Сторожовий потік для event loop.
+
+    Кожні LOOP_WATCHDOG_INTERVAL_MS потік ставить у loop порожній callback і чекає,
+    поки той виконається. Затримка — це лаг loop. Якщо callback не виконався за
+    LOOP_WATCHDOG_THRESHOLD_MS, loop заблоковано синхронним викликом (SQLAlchemy,
+    googleapiclient .execute(), requests.get): потік знімає стек потоку loop,
+    визначає хендлер/завдання (зареєстровані через @profiled, інакше — найглибший
+    кадр з коду проєкту), пише попередження зі стеком і рахує метрики. Коли loop
+    відновлюється, в лог іде повна тривалість блокування.
+    """
+
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._beat = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Запускає сторожа. Викликати з потоку event loop."""
+        if self._thread is not None or settings.LOOP_WATCHDOG_THRESHOLD_MS <= 0:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"[Watchdog] Сторож event loop запущено (поріг {settings.LOOP_WATCHDOG_THRESHOLD_MS} мс).")
+
+    def stop(self):
+        self._stop.set()
+        self._beat.set()
+
+    def _run(self):
+        interval = settings.LOOP_WATCHDOG_INTERVAL_MS / 1000
+        threshold = settings.LOOP_WATCHDOG_THRESHOLD_MS / 1000
+
+        while not self._stop.wait(interval):
+            self._beat.clear()
+            sent = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(self._beat.set)
+            except RuntimeError:
+                # Loop закрито — бот зупиняється
+                return
+            if self._beat.wait(threshold):
+                continue
+
+            handler, stack = self._capture_loop_stack()
+            metrics.inc('loop_block_incidents', handler=handler)
+            logger.warning(
+                f"[Watchdog] Event loop заблоковано понад {settings.LOOP_WATCHDOG_THRESHOLD_MS} мс "
+                f"(виконується: {handler}). Стек потоку loop:\n{stack}",
+                extra={'job': handler}
+            )
+
+            # Чекаємо, поки loop оживе, щоб зафіксувати повну тривалість блокування
+            self._beat.wait()
+            if self._stop.is_set():
+                return
+            blocked_ms = round((time.monotonic() - sent) * 1000)
+            metrics.inc('loop_blocked_ms', blocked_ms, handler=handler)
+            logger.warning(f"[Watchdog] Event loop відновився через {blocked_ms} мс (виконувалось: {handler}).",
+                           extra={'job': handler, 'duration_ms': blocked_ms})
+
+    def _capture_loop_stack(self) -> tuple[str, str]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return 'unknown', ''
+        summary = traceback.extract_stack(frame)
+
+        codes = []
+        while frame is not None:
+            codes.append(frame.f_code)
+            frame = frame.f_back
+        codes.reverse()
+
+        handler = profiler.target_name(codes)
+        if handler is None:
+            # Незареєстрований код: найглибший кадр проєкту (напр. функція сервісу чи middleware)
+            own = [c for c in codes if c.co_filename.startswith(PROJECT_SRC_DIR)]
+            handler = own[-1].co_qualname if own else 'unknown'
+        return handler, ''.join(traceback.format_list(summary[-STACK_LIMIT:]))
+
+
+loop_watchdog = LoopWatchdog()
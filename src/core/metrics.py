@@ -0,0 +1,33 @@
+import threading
+from collections import Counter
+
+
+class Metrics:
+    """
+    Прості in-process лічильники (без зовнішніх залежностей).
+    Ключ — назва метрики та відсортовані мітки, напр. ('throttle_rejected', (('router', 'testing'),)).
+    """
+
+    def __init__(self):
+        self._counters = Counter()
+        # Лічильники оновлюються і з event loop, і з потоків планувальника
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: int = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += value
+
+    def snapshot(self) -> dict[str, int]:
+        """Повертає копію лічильників у вигляді {'name{label=value}': count}."""
+        with self._lock:
+            items = list(self._counters.items())
+        result = {}
+        for (name, labels), value in sorted(items):
+            label_str = ",".join(f"{k}={v}" for k, v in labels)
+            result[f"{name}{{{label_str}}}" if label_str else name] = value
+        return result
+
+
+# Єдиний екземпляр метрик для всього процесу
+metrics = Metrics()
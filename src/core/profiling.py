@@ -0,0 +1,175 @@
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Callable
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# Скільки рядків у топ-списках функцій та алокацій
+TOP_N = 30
+# Глибина трасування алокацій tracemalloc (кадрів на алокацію)
+TRACEMALLOC_FRAMES = 25
+# Назва для всіх стеків потоку event loop (незалежно від хендлера)
+EVENT_LOOP_PROFILE = 'event_loop'
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Профілювання на вимогу (адмін-команда /profile або PROFILE_ON_START_SECONDS).
+
+    Окремий потік кожні PROFILE_SAMPLE_INTERVAL_MS знімає стеки всіх потоків
+    (sys._current_frames) і зараховує зразок тому зареєстрованому хендлеру чи
+    завданню, чия функція є в стеку. Хендлери не обгортаються: @profiled лише
+    запам'ятовує code object, тож коли профілювання вимкнене, вартість нульова,
+    а конкурентні корутини не заважають одна одній (на відміну від cProfile).
+    Опційно вмикається tracemalloc для топ-списку алокацій.
+    """
+
+    def __init__(self):
+        # code object -> назва профілю
+        self._targets: dict = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._last_dump_dir: str | None = None
+
+    def register(self, func: Callable, name: str | None = None) -> Callable:
+        """Реєструє функцію (хендлер, завдання) для атрибуції зразків. Повертає її без змін."""
+        code = getattr(func, '__code__', None)
+        if code is not None:
+            self._targets[code] = name or func.__qualname__
+        return func
+
+    def target_name(self, codes) -> str | None:
+        """Назва найглибшої зареєстрованої функції серед code objects стеку (від зовнішнього до внутрішнього)."""
+        return next((self._targets[c] for c in reversed(codes) if c in self._targets), None)
+
+    @property
+    def active(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, trace_memory: bool = False) -> bool:
+        """Запускає профілювання на seconds секунд. False — якщо воно вже триває."""
+        with self._lock:
+            if self.active:
+                return False
+            self._stop.clear()
+            if trace_memory and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._thread = threading.Thread(
+                target=self._run, args=(threading.get_ident(), seconds, trace_memory),
+                name='sampling-profiler', daemon=True
+            )
+            self._thread.start()
+        logger.info(f"[Profiler] Профілювання запущено на {seconds} с (tracemalloc: {trace_memory}).")
+        return True
+
+    def stop(self):
+        """Достроково завершує профілювання (результати все одно зберігаються)."""
+        self._stop.set()
+
+    def join(self) -> str | None:
+        """Чекає завершення (блокує — викликати з потоку) і повертає директорію з результатами."""
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self._last_dump_dir
+
+    def _run(self, loop_thread_id: int, seconds: float, trace_memory: bool):
+        interval = settings.PROFILE_SAMPLE_INTERVAL_MS / 1000
+        deadline = time.monotonic() + seconds
+        own_id = threading.get_ident()
+        # назва профілю -> Counter складених стеків ("a;b;c" -> кількість зразків)
+        stacks: dict[str, Counter] = defaultdict(Counter)
+        samples = 0
+
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                folded = ";".join(_frame_label(code) for code in codes)
+
+                if thread_id == loop_thread_id:
+                    stacks[EVENT_LOOP_PROFILE][folded] += 1
+                # Зразок належить найглибшій зареєстрованій функції в стеку
+                name = self.target_name(codes)
+                if name is not None:
+                    stacks[name][folded] += 1
+            samples += 1
+            self._stop.wait(interval)
+
+        snapshot = None
+        if trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        try:
+            self._last_dump_dir = self._dump(stacks, snapshot, samples)
+            logger.info(f"[Profiler] Профілювання завершено ({samples} зразків): {self._last_dump_dir}")
+        except Exception as e:
+            logger.error(f"[Profiler] Не вдалося зберегти результати профілювання: {e}")
+
+    @staticmethod
+    def _dump(stacks: dict[str, Counter], snapshot, samples: int) -> str:
+        dump_dir = os.path.join(settings.PROFILE_DIR, datetime.datetime.now().strftime('%Y%m%d_%H%M%S'))
+        os.makedirs(dump_dir, exist_ok=True)
+
+        summary = [f"Зразків: {samples}, інтервал: {settings.PROFILE_SAMPLE_INTERVAL_MS} мс", ""]
+        for name, folded_stacks in sorted(stacks.items()):
+            # Формат "folded" — вхід для flamegraph.pl / speedscope
+            with open(os.path.join(dump_dir, f"{name}.folded"), 'w', encoding='utf-8') as f:
+                for folded, count in folded_stacks.most_common():
+                    f.write(f"{folded} {count}\n")
+
+            total = sum(folded_stacks.values())
+            self_time, cumulative = Counter(), Counter()
+            for folded, count in folded_stacks.items():
+                frames = folded.split(";")
+                self_time[frames[-1]] += count
+                for label in set(frames):
+                    cumulative[label] += count
+            summary.append(f"=== {name}: {total} зразків (~{total * settings.PROFILE_SAMPLE_INTERVAL_MS} мс) ===")
+            summary.append("Власний час:")
+            summary += [f"  {count:>7}  {count / total:6.1%}  {label}" for label, count in self_time.most_common(TOP_N)]
+            summary.append("Сукупний час:")
+            summary += [f"  {count:>7}  {count / total:6.1%}  {label}" for label, count in cumulative.most_common(TOP_N)]
+            summary.append("")
+
+        with open(os.path.join(dump_dir, 'summary.txt'), 'w', encoding='utf-8') as f:
+            f.write("\n".join(summary))
+
+        if snapshot is not None:
+            snapshot.dump(os.path.join(dump_dir, 'tracemalloc.snapshot'))
+            lines = ["Топ алокацій за рядком:"]
+            lines += [f"  {stat}" for stat in snapshot.statistics('lineno')[:TOP_N]]
+            lines += ["", "Топ алокацій за файлом:"]
+            lines += [f"  {stat}" for stat in snapshot.statistics('filename')[:TOP_N]]
+            with open(os.path.join(dump_dir, 'allocations.txt'), 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines))
+
+        return dump_dir
+
+
+profiler = SamplingProfiler()
+
+
+def profiled(name: str | None = None) -> Callable:
+    """Декоратор: реєструє хендлер чи завдання в профайлері, не змінюючи саму функцію."""
+    def decorator(func: Callable) -> Callable:
+        return profiler.register(func, name)
+    return decorator
@@ -1,6 +1,7 @@
 import datetime
-from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text
-from sqlalchemy import BigInteger
+from sqlalchemy import Column, Integer, String, Boolean, Date, DateTime, ForeignKey, Text, Float
+from sqlalchemy import BigInteger, Index, func
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship, declarative_base
 
 # База для декларативного визначення моделей
@@ -19,6 +20,9 @@ class Intern(Base):
     # Зворотний зв'язок 1:1 з User
     user = relationship("User", back_populates="intern", uselist=False)
 
+    # Функціональний індекс для пошуку ПІНа без урахування регістру
+    __table_args__ = (Index('ix_interns_pin_lower', func.lower(pin)),)
+
 
 class User(Base):
     """Таблиця зареєстрованих користувачів бота."""
@@ -37,6 +41,23 @@ class User(Base):
     sessions = relationship("TestSession", back_populates="user")
 
 
+class QuestionBank(Base):
+    """
+    Версія банку питань. Імпорт зміненого документа будує нову версію поруч із поточною,
+    а потім атомарно перемикає прапорець is_active.
+    """
+    __tablename__ = 'question_banks'
+
+    id = Column(Integer, primary_key=True, index=True)  # Номер версії
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    question_count = Column(Integer, nullable=False, default=0)
+    is_active = Column(Boolean, nullable=False, default=False, index=True)
+    # Хеш змісту документа, з якого зібрано версію: імпорт без змін не створює нову версію
+    content_hash = Column(String(64), nullable=True)
+
+    questions = relationship("Question", back_populates="bank")
+
+
 class Question(Base):
     """Таблиця питань для тестів."""
     __tablename__ = 'questions'
@@ -44,6 +65,11 @@ class Question(Base):
     id = Column(Integer, primary_key=True, index=True)
     text = Column(Text, nullable=False)  # ТЕКСТ ПИТАННЯ
     photo_url = Column(String, nullable=True)  # Опціональний шлях/URL до фото
+    photo_size = Column(Integer, nullable=True)  # Розмір файлу фото після нормалізації (байт)
+    # Версія банку, до якої належить питання (NULL — питання, імпортовані до версіонування)
+    bank_id = Column(Integer, ForeignKey('question_banks.id'), nullable=True, index=True)
+
+    bank = relationship("QuestionBank", back_populates="questions")
 
     # Зв'язок 1:N з AnswerOption
     options = relationship("AnswerOption", back_populates="question")
@@ -71,7 +97,7 @@ class TestSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     # User ID в цій таблиці походить з таблиці users, де id має тип Integer,
     # тому тут можна залишити Integer.
-    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)  # Користувач
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)  # Користувач
 
     start_time = Column(DateTime, default=datetime.datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
@@ -79,6 +105,19 @@ class TestSession(Base):
     score = Column(Integer, default=0)  # Кількість правильних відповідей
     max_score = Column(Integer, default=20)  # Загальна кількість питань у тесті (20)
     is_completed = Column(Boolean, default=False)
+    # Сесія підготовлена заздалегідь (до SCHEDULE_TIME), але питання ще не надіслано
+    is_pending = Column(Boolean, nullable=False, default=False)
+    # Версія банку питань, на якій стартувала сесія
+    bank_id = Column(Integer, ForeignKey('question_banks.id'), nullable=True, index=True)
+    # Коли звіт про завершену сесію доставлено адміністратору (NULL — ще не доставлено).
+    # Дайджест вибирає недоставлені сесії з БД, тож перезапуск чи збій відправки їх не губить.
+    report_sent_at = Column(DateTime, nullable=True)
+
+    # Компактне зберігання відповідей (PACKED_ANSWERS): паралельні масиви замість рядків
+    # user_answers. NULL — сесія зберігає відповіді рядками.
+    answer_question_ids = Column(ARRAY(Integer), nullable=True)
+    answer_option_ids = Column(ARRAY(Integer), nullable=True)
+    answer_correct = Column(ARRAY(Boolean), nullable=True)
 
     user = relationship("User", back_populates="sessions")
     answers = relationship("UserAnswer", back_populates="session")
@@ -92,7 +131,7 @@ class UserAnswer(Base):
     __tablename__ = 'user_answers'
 
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey('test_sessions.id'), nullable=False)
+    session_id = Column(Integer, ForeignKey('test_sessions.id'), nullable=False, index=True)
     question_id = Column(Integer, ForeignKey('questions.id'), nullable=False)
     # ID обраного варіанту відповіді
     selected_option_id = Column(Integer, ForeignKey('answer_options.id'), nullable=False)
@@ -102,3 +141,94 @@ class UserAnswer(Base):
     session = relationship("TestSession", back_populates="answers")
     question = relationship("Question")
     selected_option = relationship("AnswerOption")
+
+
+class TestSessionArchive(Base):
+    """
+    Архів завершених сесій, старших за RETENTION_DAYS.
+    Колонки та зв'язки повторюють TestSession, тож звіти читають обидві таблиці однаково.
+    """
+    __tablename__ = 'test_sessions_archive'
+
+    id = Column(Integer, primary_key=True)  # Той самий ID, що був у test_sessions
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    start_time = Column(DateTime)
+    end_time = Column(DateTime, index=True)
+    score = Column(Integer, default=0)
+    max_score = Column(Integer, default=20)
+    is_completed = Column(Boolean, default=True)
+    bank_id = Column(Integer, ForeignKey('question_banks.id'), nullable=True)
+    answer_question_ids = Column(ARRAY(Integer), nullable=True)
+    answer_option_ids = Column(ARRAY(Integer), nullable=True)
+    answer_correct = Column(ARRAY(Boolean), nullable=True)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    user = relationship("User")
+    answers = relationship("UserAnswerArchive", back_populates="session")
+
+
+class UserAnswerArchive(Base):
+    """Архів відповідей для сесій з test_sessions_archive."""
+    __tablename__ = 'user_answers_archive'
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(Integer, ForeignKey('test_sessions_archive.id'), nullable=False, index=True)
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=False)
+    selected_option_id = Column(Integer, ForeignKey('answer_options.id'), nullable=False)
+    is_correct = Column(Boolean, nullable=False)
+
+    session = relationship("TestSessionArchive", back_populates="answers")
+    question = relationship("Question")
+    selected_option = relationship("AnswerOption")
+
+
+class QuestionStat(Base):
+    """
+    Інкрементні лічильники по питанню (оновлюються під час запису відповіді).
+    Дозволяють оцінити складність питань без сканування user_answers.
+    """
+    __tablename__ = 'question_stats'
+
+    question_id = Column(Integer, ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    times_asked = Column(Integer, nullable=False, default=0)  # Скільки разів на питання відповіли
+    times_correct = Column(Integer, nullable=False, default=0)  # Скільки з них правильно
+
+    question = relationship("Question")
+
+
+class AnswerOptionStat(Base):
+    """Лічильник вибору кожного варіанту відповіді."""
+    __tablename__ = 'answer_option_stats'
+
+    option_id = Column(Integer, ForeignKey('answer_options.id', ondelete='CASCADE'), primary_key=True)
+    question_id = Column(Integer, ForeignKey('questions.id', ondelete='CASCADE'), nullable=False, index=True)
+    times_picked = Column(Integer, nullable=False, default=0)
+
+    option = relationship("AnswerOption")
+
+
+class QuestionAnalysis(Base):
+    """
+    Психометричні показники питання з останнього прогону пакетного аналізу.
+    Таблиця повністю перезаписується кожним прогоном.
+    """
+    __tablename__ = 'question_analysis'
+
+    question_id = Column(Integer, primary_key=True)
+    n_responses = Column(Integer, nullable=False)
+    difficulty = Column(Float, nullable=True)  # Частка правильних відповідей (p)
+    discrimination = Column(Float, nullable=True)  # Індекс дискримінації (верхні 27% − нижні 27%)
+    point_biserial = Column(Float, nullable=True)  # Кореляція питання з рештою балу
+    computed_at = Column(DateTime, nullable=False)
+
+
+class AnalysisRun(Base):
+    """Підсумок одного прогону аналізу питань (рівень тесту)."""
+    __tablename__ = 'analysis_runs'
+
+    id = Column(Integer, primary_key=True, index=True)
+    computed_at = Column(DateTime, nullable=False, index=True)
+    n_sessions = Column(Integer, nullable=False)
+    n_items = Column(Integer, nullable=False)
+    mean_score = Column(Float, nullable=False)
+    kr20 = Column(Float, nullable=True)  # Надійність тесту (Kuder–Richardson 20)
@@ -1,7 +1,11 @@
-from sqlalchemy import create_engine
+import logging
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, Session
 from .models import Base  # Імпортуємо Base з наших моделей
 from src.core.config import settings # ⬅️ ЗМІНА 1: Імпортуємо налаштування
+from src.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 # --- 1. Налаштування URL та Engine ---
 
@@ -20,14 +24,71 @@ engine = create_engine(
 # SessionLocal - це фабрика (клас), яка створює об'єкти Session.
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- 2.1. Репліка для читання ---
+
+# Важкі читання (звіти, експорт, аналітика) за наявності репліки йдуть на неї,
+# щоб не конкурувати з записами відповідей на основній БД.
+replica_engine = create_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+# Стан реплікації: (чи WAL-приймач справді отримує дані, відставання в секундах).
+# Якщо все отримане вже застосовано, репліка наздогнала основну БД
+# (pg_last_xact_replay_timestamp при відсутності записів лише "старіє"). Але receive = replay
+# і тоді, коли приймач зупинився (напр. мережевий розрив): тому окремо перевіряємо, що
+# pg_stat_wal_receiver у стані streaming і останнє повідомлення від основної БД (дані або
+# keepalive) було не раніше ніж REPLICA_RECEIPT_TIMEOUT_SECONDS тому.
+REPLICA_LAG_SQL = text(
+    "SELECT EXISTS ("
+    "  SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming' "
+    "  AND last_msg_receipt_time > now() - make_interval(secs => :receipt_timeout)"
+    "), "
+    "CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
 # --- 3. Функція ініціалізації БД ---
 
+# create_all() не додає нові колонки до вже існуючих таблиць, тому такі зміни
+# схеми описуємо тут ідемпотентними ALTER-запитами (PostgreSQL).
+SCHEMA_UPGRADES = [
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS is_pending BOOLEAN NOT NULL DEFAULT FALSE",
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS bank_id INTEGER REFERENCES question_banks(id)",
+    "CREATE INDEX IF NOT EXISTS ix_questions_bank_id ON questions (bank_id)",
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS bank_id INTEGER REFERENCES question_banks(id)",
+    "CREATE INDEX IF NOT EXISTS ix_test_sessions_bank_id ON test_sessions (bank_id)",
+    "ALTER TABLE questions ADD COLUMN IF NOT EXISTS photo_size INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_interns_pin_lower ON interns (lower(pin))",
+    "CREATE INDEX IF NOT EXISTS ix_user_answers_session_id ON user_answers (session_id)",
+    "CREATE INDEX IF NOT EXISTS ix_test_sessions_user_id ON test_sessions (user_id)",
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS answer_question_ids INTEGER[]",
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS answer_option_ids INTEGER[]",
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS answer_correct BOOLEAN[]",
+    "ALTER TABLE test_sessions_archive ADD COLUMN IF NOT EXISTS answer_question_ids INTEGER[]",
+    "ALTER TABLE test_sessions_archive ADD COLUMN IF NOT EXISTS answer_option_ids INTEGER[]",
+    "ALTER TABLE test_sessions_archive ADD COLUMN IF NOT EXISTS answer_correct BOOLEAN[]",
+    "ALTER TABLE question_banks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    # Наявні сесії отримують now() (вважаються вже звітованими), нові — NULL
+    "ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS report_sent_at TIMESTAMP DEFAULT now()",
+    "ALTER TABLE test_sessions ALTER COLUMN report_sent_at DROP DEFAULT",
+    "CREATE INDEX IF NOT EXISTS ix_test_sessions_report_unsent ON test_sessions (end_time) "
+    "WHERE is_completed AND report_sent_at IS NULL",
+]
+
+
+def _apply_schema_upgrades():
+    """Додає до існуючих таблиць колонки, що з'явилися в моделях пізніше."""
+    with engine.begin() as conn:
+        for statement in SCHEMA_UPGRADES:
+            conn.execute(text(statement))
+
+
 def init_db():
     """Створює таблиці в базі даних на основі моделей, якщо вони ще не існують."""
     # Base.metadata.create_all() тепер створює схему, сумісну з PostgreSQL.
     Base.metadata.create_all(bind=engine)
+    _apply_schema_upgrades()
     # Змінюємо повідомлення, щоб відображати нову БД
-    print("База даних PostgreSQL та таблиці успішно ініціалізовані.")
+    logger.info("База даних PostgreSQL та таблиці успішно ініціалізовані.")
 
 # --- 4. Функція для отримання сесії ---
 
@@ -39,4 +100,70 @@ def get_db() -> Session:
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# --- 5. Маршрутизація читань на репліку ---
+
+def primary_wal_lsn() -> str | None:
+    """
+    Поточна позиція WAL основної БД. Передається в read_session(min_lsn=...), коли
+    читання має побачити щойно закомічені дані. Без репліки запит не виконується.
+    """
+    if replica_engine is None:
+        return None
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar()
+
+
+def _read_engine(min_lsn: str | None = None):
+    """
+    Обирає двигун для читання: репліку, якщо вона свіжа, інакше основну БД.
+    З min_lsn репліка має вже застосувати WAL до цієї позиції; без нього —
+    відставати не більше ніж на REPLICA_MAX_LAG_SECONDS.
+    """
+    if replica_engine is None:
+        return engine
+    try:
+        with replica_engine.connect() as conn:
+            if min_lsn is not None:
+                fresh = conn.execute(
+                    text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)"), {'lsn': min_lsn}
+                ).scalar()
+            else:
+                streaming, lag = conn.execute(
+                    REPLICA_LAG_SQL, {'receipt_timeout': settings.REPLICA_RECEIPT_TIMEOUT_SECONDS}
+                ).one()
+                if not streaming:
+                    # Приймач WAL не працює — відставання невідоме, репліка може бути як завгодно застарілою
+                    logger.warning("[DB] Репліка не отримує WAL від основної БД (або користувачу бракує ролі "
+                                   "pg_read_all_stats), читаємо з основної БД.")
+                    metrics.inc('replica_fallback', reason='not_streaming')
+                    return engine
+                fresh = lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+    except Exception as e:
+        logger.warning(f"[DB] Репліка недоступна, читаємо з основної БД: {e}")
+        metrics.inc('replica_fallback', reason='error')
+        return engine
+
+    if not fresh:
+        metrics.inc('replica_fallback', reason='stale')
+        return engine
+    metrics.inc('replica_reads')
+    return replica_engine
+
+
+def read_session(min_lsn: str | None = None) -> Session:
+    """Сесія лише для читання: на репліці, якщо вона налаштована і достатньо свіжа."""
+    return ReadSessionLocal(bind=_read_engine(min_lsn))
+
+
+def get_read_db(min_lsn: str | None = None) -> Session:
+    """
+    Аналог get_db() для важких читань (див. read_session).
+    """
+    db = read_session(min_lsn)
+    try:
+        yield db
+    finally:
+        db.close()
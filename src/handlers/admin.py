@@ -0,0 +1,221 @@
+import logging
+import asyncio
+import datetime
+
+from aiogram import Router, types, F, Bot
+from aiogram.filters import Command, CommandObject
+
+from ..core.config import settings
+from ..core.metrics import metrics
+from ..core.profiling import profiler
+from ..database.session import SessionLocal, read_session
+from ..services.export_service import ExportService, ExportError, SUPPORTED_FORMATS
+from ..services.stats_service import QuestionStatsService
+from ..services.analytics_service import ItemAnalysisService
+from ..services.reporting_service import ReportingService, find_report_session_id, split_message
+
+logger = logging.getLogger(__name__)
+
+# Роутер для адмін-команд: працює лише в чаті адміністратора
+admin_router = Router()
+admin_router.message.filter(F.chat.id == settings.ADMIN_CHAT_ID)
+
+# Скільки найскладніших/найлегших питань показує /stats
+STATS_TOP_N = 10
+
+EXPORT_USAGE = (
+    "Використання:\n"
+    "/export <csv|parquet> [з YYYY-MM-DD] [по YYYY-MM-DD]\n"
+    "/export <csv|parquet> cohort <YYYY-MM-DD> — стажери з датою закінчення стажування"
+)
+
+
+def _parse_date(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _run_export(fmt: str, date_from, date_to, cohort_date) -> tuple[str, int]:
+    """Синхронний експорт з власною сесією БД (виконується в окремому потоці, читає з репліки)."""
+    with read_session() as db:
+        return ExportService(db).export(fmt, date_from=date_from, date_to=date_to, cohort_date=cohort_date)
+
+
+# --- /export: потоковий експорт сесій і відповідей ---
+@admin_router.message(Command("export"))
+async def handle_export(message: types.Message, command: CommandObject):
+    args = (command.args or "").split()
+    if not args or args[0] not in SUPPORTED_FORMATS:
+        await message.answer(EXPORT_USAGE, parse_mode=None)
+        return
+
+    fmt, rest = args[0], args[1:]
+    date_from = date_to = cohort_date = None
+    try:
+        if rest and rest[0] == 'cohort':
+            cohort_date = _parse_date(rest[1])
+        else:
+            date_from = _parse_date(rest[0]) if len(rest) > 0 else None
+            date_to = _parse_date(rest[1]) if len(rest) > 1 else None
+    except (ValueError, IndexError):
+        await message.answer(EXPORT_USAGE, parse_mode=None)
+        return
+
+    await message.answer("⏳ Формую експорт...", parse_mode=None)
+    try:
+        # Експорт читає БД і пише файл блокуюче — виносимо з event loop
+        filepath, row_count = await asyncio.to_thread(_run_export, fmt, date_from, date_to, cohort_date)
+    except ExportError as e:
+        await message.answer(f"❌ {e}", parse_mode=None)
+        return
+    except Exception as e:
+        logger.error(f"❌ Помилка експорту: {e}")
+        await message.answer("⚠️ Не вдалося сформувати експорт.", parse_mode=None)
+        return
+
+    await message.answer_document(
+        types.FSInputFile(filepath),
+        caption=f"📦 Експорт: {row_count} рядків",
+        parse_mode=None
+    )
+
+
+def _format_stat_line(stat: dict) -> str:
+    text = stat['text'] if len(stat['text']) <= 80 else stat['text'][:77] + "..."
+    line = f"• {round(stat['correct_rate'] * 100)}% ({stat['times_correct']}/{stat['times_asked']}) — {text}"
+    wrong_picks = [o for o in stat['option_picks'] if not o['is_correct']]
+    if wrong_picks:
+        line += f"\n   частіша помилка: «{wrong_picks[0]['text'][:60]}» ×{wrong_picks[0]['times_picked']}"
+    return line
+
+
+# --- /stats: складність питань за інкрементними лічильниками ---
+@admin_router.message(Command("stats"))
+async def handle_stats(message: types.Message):
+    with read_session() as db:
+        stats = QuestionStatsService(db).get_question_stats()
+
+    if not stats:
+        await message.answer("ℹ️ Статистика ще порожня: жодної відповіді не записано.", parse_mode=None)
+        return
+
+    hardest = stats[:STATS_TOP_N]
+    easiest = list(reversed(stats[-STATS_TOP_N:]))
+    lines = [f"📊 Статистика питань (з відповідями: {len(stats)})", "", "🔴 Найскладніші:"]
+    lines += [_format_stat_line(s) for s in hardest]
+    lines += ["", "🟢 Найлегші:"]
+    lines += [_format_stat_line(s) for s in easiest]
+
+    await message.answer("\n".join(lines)[:4096], parse_mode=None)
+
+
+def _run_item_analysis() -> str | None:
+    with SessionLocal() as db, read_session() as read_db:
+        service = ItemAnalysisService(db, read_db)
+        service.run()
+        return service.build_report()
+
+
+# --- /analysis: пакетний психометричний аналіз питань ---
+@admin_router.message(Command("analysis"))
+async def handle_analysis(message: types.Message):
+    await message.answer("⏳ Виконую аналіз питань...", parse_mode=None)
+    try:
+        report = await asyncio.to_thread(_run_item_analysis)
+    except Exception as e:
+        logger.error(f"❌ Помилка аналізу питань: {e}")
+        await message.answer("⚠️ Не вдалося виконати аналіз.", parse_mode=None)
+        return
+
+    if not report:
+        await message.answer("ℹ️ Немає завершених сесій для аналізу.", parse_mode=None)
+        return
+    await message.answer(report[:4096], parse_mode=None)
+
+
+REPORT_USAGE = (
+    "Використання:\n"
+    "/report <ПІН стажера> — остання завершена сесія стажера\n"
+    "/report s:<ID сесії> — конкретна сесія"
+)
+
+
+def _find_report(key: str, bot: Bot) -> tuple[str, str] | None:
+    """Пошук сесії та рендер звіту (виконується в окремому потоці, читає з репліки)."""
+    # Звіти завершених сесій зазвичай уже в кеші — тоді БД потрібна лише для пошуку сесії
+    with read_session() as db:
+        session_id = find_report_session_id(db, key)
+        return ReportingService(db, bot).get_rendered_report(session_id) if session_id else None
+
+
+# --- /report: звіт про сесію за ID сесії або ПІН стажера ---
+@admin_router.message(Command("report"))
+async def handle_report(message: types.Message, command: CommandObject, bot: Bot):
+    key = (command.args or "").strip()
+    if not key:
+        await message.answer(REPORT_USAGE, parse_mode=None)
+        return
+
+    try:
+        rendered = await asyncio.to_thread(_find_report, key, bot)
+    except Exception as e:
+        logger.error(f"❌ Помилка пошуку звіту за «{key}»: {e}")
+        await message.answer("⚠️ Не вдалося сформувати звіт.", parse_mode=None)
+        return
+
+    if not rendered:
+        await message.answer(f"ℹ️ Сесію за «{key}» не знайдено.", parse_mode=None)
+        return
+    # Довгий звіт надсилаємо кількома повідомленнями, не обрізаючи
+    for part in split_message(rendered[0]):
+        await message.answer(part, parse_mode="MarkdownV2")
+
+
+PROFILE_USAGE = (
+    "Використання:\n"
+    "/profile <секунди> [mem] — профілювання хендлерів і завдань (mem — ще й топ алокацій)\n"
+    "/profile stop — завершити достроково"
+)
+# Верхня межа тривалості, щоб забуте профілювання не працювало годинами
+PROFILE_MAX_SECONDS = 600
+# Посилання на фонові задачі, щоб їх не прибрав збирач сміття до завершення
+_background_tasks: set[asyncio.Task] = set()
+
+
+async def _report_profile_result(message: types.Message):
+    # join() блокує до кінця профілювання — чекаємо в потоці, не займаючи event loop
+    dump_dir = await asyncio.to_thread(profiler.join)
+    await message.answer(f"✅ Профілювання завершено. Результати: {dump_dir}", parse_mode=None)
+
+
+# --- /profile: профілювання на вимогу ---
+@admin_router.message(Command("profile"))
+async def handle_profile(message: types.Message, command: CommandObject):
+    args = (command.args or "").split()
+    if args == ["stop"]:
+        profiler.stop()
+        await message.answer("⏹ Профілювання зупиняється...", parse_mode=None)
+        return
+    if not args or not args[0].isdigit() or not 0 < int(args[0]) <= PROFILE_MAX_SECONDS:
+        await message.answer(PROFILE_USAGE, parse_mode=None)
+        return
+
+    seconds, trace_memory = int(args[0]), "mem" in args[1:]
+    if not profiler.start(seconds, trace_memory=trace_memory):
+        await message.answer("ℹ️ Профілювання вже триває.", parse_mode=None)
+        return
+    await message.answer(f"⏱ Профілювання запущено на {seconds} с.", parse_mode=None)
+    # Відповідь про результат — окремою задачею: адмін-команди цього чату не чекають
+    task = asyncio.create_task(_report_profile_result(message))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+# --- /metrics: внутрішні лічильники процесу ---
+@admin_router.message(Command("metrics"))
+async def handle_metrics(message: types.Message):
+    snapshot = metrics.snapshot()
+    if not snapshot:
+        await message.answer("ℹ️ Метрик ще немає.", parse_mode=None)
+        return
+    lines = ["📈 Метрики:"] + [f"{name} = {value}" for name, value in snapshot.items()]
+    await message.answer("\n".join(lines)[:4096], parse_mode=None)
@@ -8,6 +8,7 @@ import re
 
 # Імпорт компонентів з нашої архітектури
 from ..core.states import RegistrationStates  # Припускаємо, що states тут
+from ..core.profiling import profiled
 from ..services.registration_service import RegistrationService, RegistrationError
 from ..database.session import get_db  # Припускаємо, що get_db тут
 
@@ -40,6 +41,7 @@ def with_db_session(func: Callable):
 # --- 1. Обробка команди /start ---
 @registration_router.message(CommandStart())
 @with_db_session
+@profiled()
 async def handle_start(message: types.Message, state: FSMContext, db_session: Session):
     user_id = message.from_user.id
     service = RegistrationService(db_session)
@@ -67,6 +69,7 @@ async def handle_start(message: types.Message, state: FSMContext, db_session: Se
 # --- 2. Обробка вводу ПІНа ---
 @registration_router.message(RegistrationStates.awaiting_pin, F.text)
 @with_db_session
+@profiled()
 async def handle_pin_input(message: types.Message, state: FSMContext, db_session: Session):
     pin = message.text.strip()
     user_id = message.from_user.id
@@ -1,3 +1,4 @@
+import logging
 from aiogram import Router, types, F, Bot
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.orm import Session
@@ -6,11 +7,18 @@ import datetime
 import re  # Додано для екранування
 
 # Імпорт компонентів нашої архітектури
+from ..core.config import settings
 from ..core.states import TestingStates
+from ..core.logger import SAMPLED
+from ..core.profiling import profiled
 from ..database.session import get_db
-from ..database.models import TestSession, Question, AnswerOption, UserAnswer, User
+from ..database.models import TestSession, Question, AnswerOption, User
 from ..services.testing_service import TestingService
 from ..services.reporting_service import finalise_session_and_report
+from ..services.stats_service import QuestionStatsService
+from ..services.answer_storage import count_answers, record_answer
+
+logger = logging.getLogger(__name__)
 
 # Константа для кількості питань у тесті (для перевірки відновлення)
 # ПРИМІТКА: Ця константа має бути оголошена в core/config.py або services/testing_service.py
@@ -35,6 +43,7 @@ def escape_markdown(text: str) -> str:
 # Обробник: /start_test - для перевірки статусу тесту (блокування/продовження), АЛЕ НЕ ДЛЯ ЗАПУСКУ НОВОГО
 # ----------------------------------------------------------------------------------------------------------------------
 @testing_router.message(F.text == "/start_test")
+@profiled()
 async def handle_start_test(message: types.Message, state: FSMContext, bot: Bot):
     """
     Обробник для перевірки статусу тесту.
@@ -60,7 +69,7 @@ async def handle_start_test(message: types.Message, state: FSMContext, bot: Bot)
 
             data = await state.get_data()
             questions_list = data.get('questions_list')
-            answered_count = db.query(UserAnswer).filter(UserAnswer.session_id == session.id).count()
+            answered_count = count_answers(db, session)
 
             # Якщо FSM-стан втрачено, ми не можемо відновити questions_list і це проблема.
             if not questions_list:
@@ -98,7 +107,7 @@ async def handle_start_test(message: types.Message, state: FSMContext, bot: Bot)
                 "⚠️ Помилка: Сесія має бути завершена, але не зафіксована. Будь ласка, зверніться до адміністратора.")
             return
 
-        elif status == 'available':
+        elif status in ('available', 'pending'):
             await message.answer(
                 "ℹ️ **Фінальний тест запускається автоматично!**\n\n"
                 "Очікуйте повідомлення з питанням сьогодні о 16:00."
@@ -116,14 +125,12 @@ async def handle_start_test(message: types.Message, state: FSMContext, bot: Bot)
 @testing_router.callback_query(
     TestingStates.in_test,
 )
+@profiled()
 async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext, bot: Bot):
     """
     Обробляє натискання на кнопку-варіант відповіді під час тестування.
     """
-    # 1. Обов'язкова відповідь на callback_query, щоб прибрати "годинник"
-    await callback_query.answer()
-
-    # 2. Вилучення даних із FSM та Callback
+    # 1. Вилучення даних із FSM та Callback
     data = await state.get_data()
     session_id = data.get('session_id')
     questions_list = data.get('questions_list')
@@ -131,6 +138,7 @@ async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext,
 
     # Фінальна перевірка FSM даних
     if session_id is None or questions_list is None or current_q_index is None:
+        await callback_query.answer()
         await callback_query.message.answer("⚠️ Помилка: Втрачено дані тесту. Зверніться до адміністратора.")
         await state.clear()
         return
@@ -138,62 +146,57 @@ async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext,
     try:
         current_question_id, answer_option_id = map(int, callback_query.data.split(':'))
     except ValueError:
+        await callback_query.answer()
         await callback_query.message.answer("⚠️ Помилка обробки відповіді. Спробуйте пізніше.")
         return
 
-    # 3. Перевірка коректності та збереження відповіді
+    # 2. Запобігання повторному натисканню.
+    # Оновлення одного користувача обробляються послідовно (UserLaneMiddleware), тому
+    # current_q_index у FSM — єдине джерело істини: повторне чи застаріле натискання
+    # відкидається тут, без жодного запиту до БД. Повідомлення НЕ редагуємо: у режимі
+    # "редагування на місці" воно вже містить наступне питання з робочою клавіатурою.
+    if current_question_id not in questions_list or current_q_index != questions_list.index(current_question_id):
+        await callback_query.answer("✅ Вашу відповідь вже прийнято (ігнорується повторне натискання).",
+                                    show_alert=False)
+        return
+
+    # Обов'язкова відповідь на callback_query, щоб прибрати "годинник"
+    await callback_query.answer()
+
+    # 3.1. Перевірка коректності та збереження відповіді
     for db in get_db():
         service = TestingService(db, bot)
         session: TestSession = db.query(TestSession).filter(TestSession.id == session_id).first()
-        question: Question = db.query(Question).filter(Question.id == current_question_id).first()
-        answer_option: AnswerOption = db.query(AnswerOption).filter(AnswerOption.id == answer_option_id).first()
-
-        if not session or not question or not answer_option:
-            await callback_query.message.answer("⚠️ Помилка: Сесія, питання або варіант відповіді не знайдено.")
-            return
-
-        # 3.1. Запобігання повторному натисканню (логіка протидії race condition)
-        # Перевіряємо, чи питання, на яке користувач щойно відповів, є поточним питанням у списку FSM.
-        if current_q_index != questions_list.index(current_question_id):
-            # Якщо користувач натиснув кнопку повторно або відповів на старе питання
-            # Редагування повідомлення (або його ігнорування)
-            try:
-                await callback_query.message.edit_text(
-                    "✅ Вашу відповідь прийнято (ігнорується повторне натискання).",
-                    reply_markup=None
-                )
-            except Exception:
-                pass  # Ігноруємо помилки редагування
-            return
-
-        # 3.2. Перевірка, чи не було вже збережено відповіді на це питання
-        existing_answer = db.query(UserAnswer).filter(
-            UserAnswer.session_id == session_id,
-            UserAnswer.question_id == current_question_id
+        answer_option: AnswerOption = db.query(AnswerOption).filter(
+            AnswerOption.id == answer_option_id,
+            AnswerOption.question_id == current_question_id
         ).first()
 
-        if existing_answer:
-            try:
-                await callback_query.message.edit_text(
-                    "✅ Вашу відповідь вже було збережено (ігнорується повторна спроба).",
-                    reply_markup=None
-                )
-            except Exception:
-                pass
+        if not session or not answer_option:
+            await callback_query.message.answer("⚠️ Помилка: Сесія, питання або варіант відповіді не знайдено.")
             return
 
-        # 3.3. Збереження відповіді
-        user_answer = UserAnswer(
-            session_id=session_id,
-            question_id=current_question_id,
-            selected_option_id=answer_option_id,
-            is_correct=answer_option.is_correct
-        )
-        db.add(user_answer)
-
-        # 3.4. Оновлення рахунку
-        session.score = (session.score or 0) + (1 if answer_option.is_correct else 0)
+        # 3.2. Збереження відповіді та оновлення рахунку (рядок user_answers або append у масиви сесії)
+        record_answer(db, session, current_question_id, answer_option_id, answer_option.is_correct)
+        # Лічильники по питанню/варіанту — у тій самій транзакції
+        QuestionStatsService(db).record_answer(current_question_id, answer_option_id, answer_option.is_correct)
         db.commit()
+        logger.log(SAMPLED, "Відповідь збережено", extra={
+            'session_id': session_id, 'user_id': callback_query.from_user.id, 'question_id': current_question_id
+        })
+
+        next_q_index = current_q_index + 1
+        next_question = None
+
+        # 3.4. Режим "редагування на місці": те саме повідомлення перетворюється на наступне
+        # питання — один виклик Bot API замість двох. Якщо тип повідомлення не підходить
+        # (текст <-> фото) або редагування не вдалося, працює звичайний шлях нижче.
+        if settings.QUESTION_FLOW_EDIT_IN_PLACE and next_q_index < len(questions_list):
+            next_question = db.query(Question).filter(Question.id == questions_list[next_q_index]).first()
+            rendered = service.render_question(next_question, next_q_index + 1)
+            if await service.edit_question_in_place(callback_query.message, rendered):
+                await state.update_data(current_q_index=next_q_index)
+                return
 
         # 3.5. Видалення кнопок та позначення відповіді
         try:
@@ -218,7 +221,8 @@ async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext,
             )
         except Exception as e:
             # Це критичний блок для уникнення збоїв
-            print(f"⚠️ Помилка редагування повідомлення: {e}")
+            logger.warning(f"⚠️ Помилка редагування повідомлення: {e}",
+                           extra={'session_id': session_id, 'user_id': callback_query.from_user.id})
             try:
                 # Спроба відправити нове, просте повідомлення, якщо редагування не вдалося
                 await callback_query.message.answer("✅ Відповідь прийнято. Перехід до наступного питання...")
@@ -226,14 +230,13 @@ async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext,
                 pass
 
         # 4. Визначення наступного кроку
-        next_q_index = current_q_index + 1
-
         if next_q_index < len(questions_list):
             # 4.1. Надсилання наступного питання
             await state.update_data(current_q_index=next_q_index)
 
-            next_question_id = questions_list[next_q_index]
-            next_question = db.query(Question).filter(Question.id == next_question_id).first()
+            if next_question is None:
+                next_question_id = questions_list[next_q_index]
+                next_question = db.query(Question).filter(Question.id == next_question_id).first()
 
             await service._send_next_question(
                 user_id=callback_query.from_user.id,
@@ -262,5 +265,6 @@ async def handle_answer(callback_query: types.CallbackQuery, state: FSMContext,
             )
             await callback_query.message.answer(result_text, parse_mode="MarkdownV2")
 
-            print(
-                f"✅ Тест для користувача {callback_query.from_user.id} завершено. Результат: {session.score}/{session.max_score}")
\ No newline at end of file
+            logger.info(
+                f"✅ Тест для користувача {callback_query.from_user.id} завершено. Результат: {session.score}/{session.max_score}",
+                extra={'session_id': session.id, 'user_id': callback_query.from_user.id})
\ No newline at end of file
@@ -0,0 +1,62 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, CallbackQuery
+from cachetools import TTLCache
+
+from ..core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Максимум користувачів, для яких одночасно зберігаються відра
+MAX_TRACKED_USERS = 100_000
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Обмеження частоти запитів на користувача (token bucket) для одного роутера.
+
+    Відро поповнюється зі швидкістю `rate` токенів/с до `burst`; кожна подія
+    забирає один токен. Якщо токенів немає — подія відкидається ще до хендлера,
+    тобто без жодної роботи з БД. Перевірка — лише арифметика над словником.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        # Неактивне відро за цей час повністю наповнюється, тож його можна забути
+        self._buckets = TTLCache(maxsize=MAX_TRACKED_USERS, ttl=max(60.0, burst / rate))
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        bucket = self._buckets.get(user.id)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+
+        if tokens < 1:
+            self._buckets[user.id] = (tokens, now)
+            metrics.inc('throttle_rejected', router=self.name)
+            logger.debug(f"[Throttle] Відхилено подію від {user.id} (роутер {self.name}).",
+                         extra={'user_id': user.id})
+            if isinstance(event, CallbackQuery):
+                # Прибираємо "годинник" на кнопці, щоб клієнт не повторював запит
+                await event.answer("⏳ Занадто часто. Зачекайте трохи.")
+            return None
+
+        self._buckets[user.id] = (tokens - 1, now)
+        metrics.inc('throttle_passed', router=self.name)
+        return await handler(event, data)
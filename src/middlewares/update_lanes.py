@@ -0,0 +1,48 @@
+import asyncio
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from ..core.metrics import metrics
+
+
+class UserLaneMiddleware(BaseMiddleware):
+    """
+    Послідовна обробка оновлень одного користувача ("смуга" на користувача).
+
+    aiogram обробляє оновлення конкурентно; ця outer-middleware на рівні update
+    бере asyncio.Lock користувача, тож два швидкі натискання одного стажера
+    виконуються строго одне за одним, а різні користувачі — паралельно.
+    asyncio.Lock віддає замок у порядку очікування (FIFO), тому порядок
+    надходження оновлень зберігається. Замки прибираються, коли смуга порожня.
+    """
+
+    def __init__(self):
+        # user_id -> [lock, кількість оновлень, що тримають або чекають замок]
+        self._lanes: dict[int, list] = {}
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+
+        lane = self._lanes.get(user.id)
+        if lane is None:
+            lane = self._lanes[user.id] = [asyncio.Lock(), 0]
+        lane[1] += 1
+        if lane[0].locked():
+            metrics.inc('update_lane_waits')
+
+        try:
+            async with lane[0]:
+                return await handler(event, data)
+        finally:
+            lane[1] -= 1
+            if lane[1] == 0:
+                del self._lanes[user.id]
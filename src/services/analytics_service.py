@@ -0,0 +1,189 @@
+# services/analytics_service.py
+
+import logging
+import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, insert, delete, union_all
+from sqlalchemy.orm import Session
+
+from ..database.models import Question, QuestionAnalysis, AnalysisRun
+from .answer_storage import answer_rows
+from .retention_service import SESSION_SOURCES
+from .testing_service import QUESTIONS_PER_TEST
+
+logger = logging.getLogger(__name__)
+
+# Частка найкращих/найгірших сесій для індексу дискримінації (класичні 27%)
+DISCRIMINATION_GROUP_SHARE = 0.27
+
+# Мінімум відповідей на питання, щоб його показники вважались надійними
+MIN_RESPONSES_PER_ITEM = 5
+
+
+class ItemAnalysisService:
+    """
+    Пакетний психометричний аналіз питань за матрицею «сесія × питання».
+
+    Кожна сесія отримує випадкові 20 питань з банку, тому матриця розріджена:
+    непоставлене питання — NaN, і всі показники рахуються nan-aware по стовпцях
+    векторизовано (numpy), без циклів по сесіях чи питаннях.
+    """
+
+    def __init__(self, db_session: Session, read_session: Session | None = None):
+        self.db = db_session
+        # Матриця відповідей — найважче читання; його можна віддати репліці
+        self.read_db = read_session or db_session
+
+    def load_matrix(self) -> pd.DataFrame:
+        """Завантажує відповіді завершених сесій (робочих та архівних, обох форматів) одним запитом і будує матрицю 0/1/NaN."""
+        parts = []
+        for session_model, answer_model in SESSION_SOURCES:
+            answers = answer_rows(session_model, answer_model)
+            parts.append(
+                select(answers.c.session_id, answers.c.question_id, answers.c.is_correct)
+                .join(session_model, session_model.id == answers.c.session_id)
+                .where(session_model.is_completed == True)
+            )
+        stmt = union_all(*parts)
+        answers = pd.read_sql(stmt, self.read_db.connection())
+        if answers.empty:
+            return pd.DataFrame()
+        answers['is_correct'] = answers['is_correct'].astype(np.float64)
+        return answers.pivot_table(index='session_id', columns='question_id', values='is_correct', aggfunc='first')
+
+    @staticmethod
+    def compute(matrix: pd.DataFrame) -> tuple[pd.DataFrame, dict]:
+        """
+        Рахує показники питань і надійність тесту.
+        Повертає (DataFrame по питаннях, словник з показниками тесту).
+        """
+        x = matrix.to_numpy(dtype=np.float64)
+        asked = ~np.isnan(x)
+        x0 = np.where(asked, x, 0.0)
+
+        n_item = asked.sum(axis=0)
+        totals = x0.sum(axis=1)
+
+        # --- Складність: частка правильних відповідей серед тих, кому питання поставили ---
+        with np.errstate(invalid='ignore', divide='ignore'):
+            difficulty = x0.sum(axis=0) / n_item
+
+        # --- Індекс дискримінації: p(верхні 27%) − p(нижні 27%) за сумарним балом ---
+        order = np.argsort(totals)
+        group_size = max(1, int(round(len(totals) * DISCRIMINATION_GROUP_SHARE)))
+        lower, upper = order[:group_size], order[-group_size:]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            p_upper = x0[upper].sum(axis=0) / asked[upper].sum(axis=0)
+            p_lower = x0[lower].sum(axis=0) / asked[lower].sum(axis=0)
+        discrimination = p_upper - p_lower
+
+        # --- Точково-бісеріальна кореляція питання з рештою балу (rest score) ---
+        rest = np.where(asked, totals[:, None] - x0, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = difficulty
+            mean_r = rest.sum(axis=0) / n_item
+            dx = np.where(asked, x0 - mean_x, 0.0)
+            dr = np.where(asked, rest - mean_r, 0.0)
+            cov = (dx * dr).sum(axis=0) / n_item
+            std_x = np.sqrt((dx ** 2).sum(axis=0) / n_item)
+            std_r = np.sqrt((dr ** 2).sum(axis=0) / n_item)
+            point_biserial = cov / (std_x * std_r)
+
+        unreliable = n_item < MIN_RESPONSES_PER_ITEM
+        discrimination[unreliable] = np.nan
+        point_biserial[unreliable] = np.nan
+
+        items = pd.DataFrame({
+            'question_id': matrix.columns.to_numpy(),
+            'n_responses': n_item,
+            'difficulty': difficulty,
+            'discrimination': discrimination,
+            'point_biserial': point_biserial,
+        })
+
+        # --- KR-20 ---
+        # Форми тесту різні, тож Σpq беремо для фактично поставлених питань кожної сесії
+        # і усереднюємо по сесіях; k — довжина тесту.
+        pq = np.nan_to_num(difficulty * (1 - difficulty))
+        mean_sum_pq = (asked * pq).sum(axis=1).mean()
+        total_var = totals.var()
+        k = QUESTIONS_PER_TEST
+        kr20 = (k / (k - 1)) * (1 - mean_sum_pq / total_var) if total_var > 0 else float('nan')
+
+        summary = {
+            'n_sessions': int(x.shape[0]),
+            'n_items': int(x.shape[1]),
+            'mean_score': float(totals.mean()),
+            'score_std': float(np.sqrt(total_var)),
+            'kr20': float(kr20),
+        }
+        return items, summary
+
+    def run(self) -> dict | None:
+        """Повний цикл: завантаження матриці, розрахунок, запис у БД. Повертає підсумок або None."""
+        started = datetime.datetime.now()
+        matrix = self.load_matrix()
+        if matrix.empty:
+            logger.info("[Analytics] Немає завершених сесій для аналізу.")
+            return None
+
+        items, summary = self.compute(matrix)
+
+        computed_at = datetime.datetime.now()
+        records = [
+            {k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()}
+            for row in items.astype(object).to_dict('records')
+        ]
+        for record in records:
+            record['computed_at'] = computed_at
+
+        # Результати попереднього прогону повністю замінюються в одній транзакції
+        self.db.execute(delete(QuestionAnalysis))
+        self.db.execute(insert(QuestionAnalysis), records)
+        self.db.add(AnalysisRun(
+            computed_at=computed_at,
+            n_sessions=summary['n_sessions'],
+            n_items=summary['n_items'],
+            mean_score=summary['mean_score'],
+            kr20=None if np.isnan(summary['kr20']) else summary['kr20'],
+        ))
+        self.db.commit()
+
+        elapsed = (datetime.datetime.now() - started).total_seconds()
+        logger.info(f"[Analytics] Аналіз {summary['n_sessions']} сесій × {summary['n_items']} питань "
+                    f"виконано за {elapsed:.2f} с. KR-20 = {summary['kr20']:.3f}")
+        return summary
+
+    def build_report(self, limit: int = 10) -> str | None:
+        """Текстовий звіт за останнім прогоном: надійність та проблемні питання."""
+        last_run = self.db.query(AnalysisRun).order_by(AnalysisRun.computed_at.desc()).first()
+        if not last_run:
+            return None
+
+        rows = (
+            self.db.query(QuestionAnalysis, Question.text)
+            .join(Question, Question.id == QuestionAnalysis.question_id)
+            .filter(QuestionAnalysis.point_biserial.isnot(None))
+            .order_by(QuestionAnalysis.point_biserial)
+            .limit(limit)
+            .all()
+        )
+
+        kr20 = f"{last_run.kr20:.3f}" if last_run.kr20 is not None else "—"
+        lines = [
+            f"🧮 Аналіз питань від {last_run.computed_at.strftime('%Y-%m-%d %H:%M')}",
+            f"Сесій: {last_run.n_sessions}, питань: {last_run.n_items}, середній бал: {last_run.mean_score:.1f}",
+            f"Надійність тесту (KR-20): {kr20}",
+            "",
+            "⚠️ Питання з найнижчою кореляцією з балом (кандидати на перегляд):",
+        ]
+        for analysis, text in rows:
+            short_text = text if len(text) <= 70 else text[:67] + "..."
+            discrimination = f"{analysis.discrimination:.2f}" if analysis.discrimination is not None else "—"
+            lines.append(
+                f"• r={analysis.point_biserial:.2f}, D={discrimination}, p={analysis.difficulty:.2f} "
+                f"(n={analysis.n_responses}) — {short_text}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,103 @@
+# services/answer_storage.py
+
+from collections import namedtuple
+
+from sqlalchemy import Integer, cast, func, null, select, union_all
+from sqlalchemy.orm import Session, selectinload
+
+from ..core.config import settings
+from ..database.models import TestSession, UserAnswer, Question
+
+# Відповідь, готова для звіту: об'єкти питання та варіантів уже завантажені
+SessionAnswer = namedtuple('SessionAnswer', ['question', 'selected_option', 'correct_option', 'is_correct'])
+
+
+def packed_fields() -> dict:
+    """
+    Початкові значення масивів для нової сесії. Формат обирається при створенні
+    сесії й не змінюється до її завершення, тож перемикання PACKED_ANSWERS безпечне.
+    """
+    if not settings.PACKED_ANSWERS:
+        return {}
+    return {'answer_question_ids': [], 'answer_option_ids': [], 'answer_correct': []}
+
+
+def is_packed(session) -> bool:
+    return session.answer_question_ids is not None
+
+
+def count_answers(db: Session, session: TestSession) -> int:
+    """Кількість відповідей у сесії незалежно від формату зберігання."""
+    if is_packed(session):
+        return len(session.answer_question_ids)
+    return db.query(UserAnswer).filter(UserAnswer.session_id == session.id).count()
+
+
+def record_answer(db: Session, session: TestSession, question_id: int, option_id: int, is_correct: bool):
+    """
+    Додає відповідь і оновлює рахунок (без commit).
+    Для упакованої сесії це один UPDATE рядка test_sessions з array_append.
+    """
+    if is_packed(session):
+        session.answer_question_ids = func.array_append(TestSession.answer_question_ids, question_id)
+        session.answer_option_ids = func.array_append(TestSession.answer_option_ids, option_id)
+        session.answer_correct = func.array_append(TestSession.answer_correct, is_correct)
+    else:
+        db.add(UserAnswer(
+            session_id=session.id,
+            question_id=question_id,
+            selected_option_id=option_id,
+            is_correct=is_correct
+        ))
+    session.score = (session.score or 0) + (1 if is_correct else 0)
+
+
+def load_session_answers(db: Session, session, answer_model=UserAnswer) -> list[SessionAnswer]:
+    """
+    Відповіді сесії в порядку надходження разом з питаннями та варіантами.
+    Упакована сесія читається з уже завантаженого рядка; питання з варіантами —
+    одним запитом на всю сесію.
+    """
+    if is_packed(session):
+        triples = list(zip(session.answer_question_ids, session.answer_option_ids, session.answer_correct))
+    else:
+        triples = db.query(answer_model.question_id, answer_model.selected_option_id, answer_model.is_correct).filter(
+            answer_model.session_id == session.id).order_by(answer_model.id).all()
+
+    question_ids = {question_id for question_id, _, _ in triples}
+    questions = {
+        question.id: question
+        for question in db.query(Question).options(selectinload(Question.options)).filter(
+            Question.id.in_(question_ids))
+    }
+
+    answers = []
+    for question_id, option_id, is_correct in triples:
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        options = {option.id: option for option in question.options}
+        correct_option = next((option for option in question.options if option.is_correct), None)
+        answers.append(SessionAnswer(question, options.get(option_id), correct_option, is_correct))
+    return answers
+
+
+def answer_rows(session_model, answer_model):
+    """
+    Підзапит з відповідями обох форматів для сесій session_model:
+    рядки answer_model плюс розгорнуті (unnest) масиви упакованих сесій.
+    Колонки: id (NULL для упакованих), session_id, question_id, selected_option_id, is_correct, position.
+    """
+    rows = select(
+        answer_model.id, answer_model.session_id, answer_model.question_id,
+        answer_model.selected_option_id, answer_model.is_correct, answer_model.id.label('position')
+    )
+    packed = select(
+        cast(null(), Integer).label('id'),
+        session_model.id.label('session_id'),
+        func.unnest(session_model.answer_question_ids).label('question_id'),
+        func.unnest(session_model.answer_option_ids).label('selected_option_id'),
+        func.unnest(session_model.answer_correct).label('is_correct'),
+        func.generate_subscripts(session_model.answer_question_ids, 1).label('position'),
+    ).where(session_model.answer_question_ids.isnot(None))
+    return union_all(rows, packed).subquery()
@@ -0,0 +1,151 @@
+# services/export_service.py
+
+import logging
+import csv
+import datetime
+import os
+from typing import Iterator
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from ..database.models import User, Intern, Question, AnswerOption
+from ..core.config import settings
+from .answer_storage import answer_rows
+from .retention_service import SESSION_SOURCES
+
+logger = logging.getLogger(__name__)
+
+# Parquet — опційна залежність (pyarrow). CSV працює без неї.
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Скільки рядків тягнемо з серверного курсора за один раз (і пишемо одним row group у Parquet)
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    'session_id', 'telegram_id', 'full_name', 'pin', 'internship_end_date',
+    'start_time', 'end_time', 'score', 'max_score', 'is_completed',
+    'answer_id', 'question_id', 'question_text', 'selected_option_text', 'is_correct',
+]
+
+SUPPORTED_FORMATS = ('csv', 'parquet')
+
+
+class ExportError(Exception):
+    """Спеціальний клас помилок для експорту результатів."""
+    pass
+
+
+class ExportService:
+    """
+    Потоковий експорт усіх сесій та їхніх відповідей у CSV/Parquet (рядок на відповідь;
+    сесія без відповідей — один рядок з порожніми колонками відповіді).
+    Рядки читаються серверним курсором (yield_per) і відразу пишуться у файл,
+    тому пам'ять процесу не залежить від обсягу user_answers.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def _build_query(self, session_model, answers, date_from: datetime.date | None,
+                     date_to: datetime.date | None, cohort_date: datetime.date | None):
+        stmt = (
+            select(
+                session_model.id, User.telegram_id, Intern.full_name, Intern.pin, Intern.internship_end_date,
+                session_model.start_time, session_model.end_time, session_model.score, session_model.max_score,
+                session_model.is_completed,
+                answers.c.id, answers.c.question_id, Question.text, AnswerOption.text, answers.c.is_correct,
+            )
+            # Від сесій: сесія без відповідей чи без прив'язаного стажера теж потрапляє в експорт
+            # (одним рядком з порожніми колонками відповіді / стажера)
+            .select_from(session_model)
+            .outerjoin(answers, answers.c.session_id == session_model.id)
+            .outerjoin(User, session_model.user_id == User.id)
+            .outerjoin(Intern, User.intern_id == Intern.id)
+            .outerjoin(Question, answers.c.question_id == Question.id)
+            .outerjoin(AnswerOption, answers.c.selected_option_id == AnswerOption.id)
+            .order_by(session_model.id, answers.c.position)
+        )
+        if date_from:
+            stmt = stmt.where(session_model.start_time >= datetime.datetime.combine(date_from, datetime.time.min))
+        if date_to:
+            stmt = stmt.where(session_model.start_time < datetime.datetime.combine(
+                date_to + datetime.timedelta(days=1), datetime.time.min))
+        if cohort_date:
+            stmt = stmt.where(Intern.internship_end_date == cohort_date)
+        return stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def iter_batches(self, date_from: datetime.date | None = None, date_to: datetime.date | None = None,
+                     cohort_date: datetime.date | None = None) -> Iterator[list[tuple]]:
+        """
+        Генерує пакети рядків (до EXPORT_BATCH_SIZE) у порядку EXPORT_COLUMNS.
+        Може використовуватися напряму як API для інших споживачів.
+        Спочатку віддає архівні сесії, потім робочі.
+        """
+        for session_model, answer_model in reversed(SESSION_SOURCES):
+            # Відповіді і рядками, і з упакованих масивів (для упакованих сесій answer_id порожній)
+            answers = answer_rows(session_model, answer_model)
+            result = self.db.execute(
+                self._build_query(session_model, answers, date_from, date_to, cohort_date)
+            )
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    def export(self, fmt: str, date_from: datetime.date | None = None, date_to: datetime.date | None = None,
+               cohort_date: datetime.date | None = None) -> tuple[str, int]:
+        """
+        Записує експорт у файл в EXPORT_DIR. Повертає (шлях до файлу, кількість рядків).
+        """
+        if fmt not in SUPPORTED_FORMATS:
+            raise ExportError(f"Непідтримуваний формат '{fmt}'. Доступні: {', '.join(SUPPORTED_FORMATS)}.")
+        if fmt == 'parquet' and pa is None:
+            raise ExportError("Для експорту в Parquet потрібен пакет pyarrow.")
+
+        os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+        filename = f"results_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+        filepath = os.path.join(settings.EXPORT_DIR, filename)
+
+        batches = self.iter_batches(date_from, date_to, cohort_date)
+        if fmt == 'csv':
+            row_count = self._write_csv(filepath, batches)
+        else:
+            row_count = self._write_parquet(filepath, batches)
+
+        logger.info(f"✅ Експорт {row_count} рядків збережено у {filepath}")
+        return filepath, row_count
+
+    def _write_csv(self, filepath: str, batches: Iterator[list[tuple]]) -> int:
+        row_count = 0
+        # utf-8-sig, щоб Excel коректно відкривав кирилицю
+        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(EXPORT_COLUMNS)
+            for batch in batches:
+                writer.writerows(batch)
+                row_count += len(batch)
+        return row_count
+
+    def _write_parquet(self, filepath: str, batches: Iterator[list[tuple]]) -> int:
+        schema = pa.schema([
+            ('session_id', pa.int64()), ('telegram_id', pa.int64()), ('full_name', pa.string()),
+            ('pin', pa.string()), ('internship_end_date', pa.date32()),
+            ('start_time', pa.timestamp('us')), ('end_time', pa.timestamp('us')),
+            ('score', pa.int32()), ('max_score', pa.int32()), ('is_completed', pa.bool_()),
+            ('answer_id', pa.int64()), ('question_id', pa.int64()), ('question_text', pa.string()),
+            ('selected_option_text', pa.string()), ('is_correct', pa.bool_()),
+        ])
+        row_count = 0
+        with pq.ParquetWriter(filepath, schema) as writer:
+            for batch in batches:
+                # Транспонуємо пакет у стовпці; кожен пакет — окремий row group
+                columns = list(zip(*batch))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema
+                ))
+                row_count += len(batch)
+        return row_count
@@ -1,10 +1,35 @@
+import logging
 import datetime
+import re
+import threading
+from cachetools import TTLCache
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError  # <<< 1. ДОДАНО ІМПОРТ
 
 # Припускаємо, що ваші моделі знаходяться на рівень вище у 'database/models'
 from ..database.models import User, Intern
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# --- Кеш зареєстрованих користувачів: telegram_id -> ПІБ стажера (або None, якщо не зареєстрований) ---
+# TTL обмежує застарілість між репліками; локально кеш скидається при реєстрації та імпорті стажерів.
+_registration_cache = TTLCache(maxsize=settings.REGISTRATION_CACHE_SIZE, ttl=settings.REGISTRATION_CACHE_TTL)
+# Імпорт стажерів виконується в потоці планувальника, тому доступ до кешу синхронізуємо
+_registration_cache_lock = threading.Lock()
+
+
+def invalidate_registration_cache():
+    """Повністю очищає кеш (напр. після імпорту стажерів, коли могли змінитися ПІБ)."""
+    with _registration_cache_lock:
+        _registration_cache.clear()
+
+
+def normalize_pin(pin: str) -> str:
+    """Нормалізація ПІНа так само, як при імпорті, але без урахування регістру."""
+    return re.sub(r'\s+', '', pin).lower()
 
 
 # --- Власне Виключення (Exception) для кращої обробки помилок ---
@@ -21,15 +46,23 @@ class RegistrationService:
     def get_intern_name_by_telegram_id(self, telegram_id: int) -> str:
         """
         Перевіряє, чи користувач вже зареєстрований, і повертає його повне ім'я.
+        Повторні виклики обслуговуються з кешу без звернення до БД.
         """
-        user = (
-            self.db.query(User)
-            .filter(User.telegram_id == telegram_id)
-            .join(Intern)
-            .first()
-        )
-        if user:
-            return user.intern.full_name
+        with _registration_cache_lock:
+            cached = _registration_cache.get(telegram_id, ...)
+        if cached is ...:
+            full_name = (
+                self.db.query(Intern.full_name)
+                .join(User, User.intern_id == Intern.id)
+                .filter(User.telegram_id == telegram_id)
+                .scalar()
+            )
+            with _registration_cache_lock:
+                _registration_cache[telegram_id] = full_name
+            cached = full_name
+
+        if cached is not None:
+            return cached
 
         raise RegistrationError("Користувача не знайдено.")
 
@@ -41,10 +74,10 @@ class RegistrationService:
         if self.db.query(User).filter(User.telegram_id == telegram_id).first():
             raise RegistrationError("Цей Telegram-акаунт вже зареєстровано.")
 
-        # 2. ПОШУК: Знайти стажера за ПІНом
+        # 2. ПОШУК: Знайти стажера за ПІНом (використовує функціональний індекс lower(pin))
         intern_record = (
             self.db.query(Intern)
-            .filter(func.lower(Intern.pin) == func.lower(pin))
+            .filter(func.lower(Intern.pin) == normalize_pin(pin))
             .first()
         )
 
@@ -64,16 +97,18 @@ class RegistrationService:
             )
             self.db.add(new_user)
             self.db.commit()
+            with _registration_cache_lock:
+                _registration_cache[telegram_id] = intern_record.full_name
             return intern_record.full_name
 
         except IntegrityError as e:  # <<< 2. ЯВНА ОБРОБКА IntegrityError
             self.db.rollback()
             # Логування повної помилки `e` тут дуже рекомендоване!
-            print(f"Помилка IntegrityError при реєстрації: {e}")
+            logger.error(f"Помилка IntegrityError при реєстрації: {e}")
             raise RegistrationError("Помилка цілісності даних. Цей ПІН або Telegram ID вже використовується.")
 
         except Exception as e:
             self.db.rollback()
             # Логування повної помилки `e` тут дуже рекомендоване!
-            print(f"Невідома внутрішня помилка при реєстрації: {e}")
+            logger.error(f"Невідома внутрішня помилка при реєстрації: {e}")
             raise RegistrationError("Виникла внутрішня помилка при реєстрації. Спробуйте пізніше.")
@@ -1,32 +1,77 @@
 # services/reporting_service.py
 
+import logging
 import datetime
+import functools
 import re
 import json  # ❗️ ДОДАНО
-from sqlalchemy.orm import Session
+import threading
+from cachetools import LRUCache
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session, joinedload
 from aiogram import Bot
+from aiogram.types import BufferedInputFile
 
 # Імпорт компонентів з нашої архітектури
-from ..database.models import User, Intern, TestSession, UserAnswer, Question, AnswerOption
+from ..database.models import User, Intern, TestSession, Question, AnswerOption
 from ..core.config import settings
-from ..database.session import get_db
+from ..core.metrics import metrics
+from ..database.session import SessionLocal, get_read_db, primary_wal_lsn
+from .registration_service import normalize_pin
+from .retention_service import find_session_with_answers, SESSION_SOURCES
 
 # --- ІМПОРТИ ДЛЯ GOOGLE DOCS API ---
 from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+logger = logging.getLogger(__name__)
+
 # ----------------------------------------
 
 # SCOPE для Google Docs API:
 DOCS_SCOPE = ["https://www.googleapis.com/auth/documents"]
 
+# Ліміти Telegram на довжину тексту повідомлення та підпису до файлу
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_CAPTION_LIMIT = 1024
+
+# --- Кеш відрендерених звітів: session_id -> (текст для Telegram, текст для документа) ---
+# Завершена сесія більше не змінюється, тож записи не застарівають; LRU обмежує пам'ять.
+_rendered_reports = LRUCache(maxsize=settings.REPORT_CACHE_SIZE)
+# Звіти рендеряться і в event loop, і в потоках адмін-команд
+_rendered_reports_lock = threading.Lock()
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list[str]:
+    """Ділить текст на частини до limit символів по межах рядків (без обрізання)."""
+    parts, current = [], ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > limit:
+            # Рядок довший за ліміт — ріжемо його жорстко
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            parts.append(current)
+            current = ""
+        current += line
+    if current:
+        parts.append(current)
+    return parts
+
 
 class ReportingService:
     def __init__(self, db_session: Session, bot: Bot):
         self.db = db_session
         self.bot = bot
-        self.docs_service = self._authenticate_google_docs()
+
+    @functools.cached_property
+    def docs_service(self):
+        # Клієнт Google Docs потрібен лише для запису звіту — створюємо його при першому зверненні
+        return self._authenticate_google_docs()
 
     # ❗️❗️❗️ ОСЬ ГОЛОВНА ЗМІНА ❗️❗️❗️
     def _authenticate_google_docs(self):
@@ -42,7 +87,7 @@ class ReportingService:
             )
             return build('docs', 'v1', credentials=creds)
         except Exception as e:
-            print(f"❌ ПОМИЛКА АУТЕНТИФІКАЦІЇ GOOGLE DOCS: {e}")
+            logger.error(f"❌ ПОМИЛКА АУТЕНТИФІКАЦІЇ GOOGLE DOCS: {e}")
             return None
 
     def _escape_md(self, text: str) -> str:
@@ -51,15 +96,40 @@ class ReportingService:
             return ""
         return re.sub(r'([_*[\]()~`>#+=\-{|}.!])', r'\\\1', text)
 
+    def get_rendered_report(self, session_id: int) -> tuple[str, str] | None:
+        """
+        Повертає (звіт для Telegram, звіт для документа). Звіт завершеної сесії
+        рендериться один раз і далі віддається з кешу без звернень до БД.
+        """
+        with _rendered_reports_lock:
+            cached = _rendered_reports.get(session_id)
+        if cached is not None:
+            metrics.inc('report_cache_hit')
+            return cached
+
+        # Сесія може бути як у робочій таблиці, так і в архіві
+        session, answers_data = find_session_with_answers(self.db, session_id)
+        if not session:
+            return None
+        rendered = (
+            self._render_telegram_report(session, answers_data),
+            self._render_doc_report(session, answers_data),
+        )
+        metrics.inc('report_cache_miss')
+        if session.is_completed:
+            with _rendered_reports_lock:
+                _rendered_reports[session_id] = rendered
+        return rendered
+
     # 🎯 МЕТОД ДЛЯ TELEGRAM
     def generate_detailed_report(self, session_id: int) -> str | None:
         """
         Формує повний детальний звіт про сесію тестування, використовуючи MarkdownV2.
         """
-        session = self.db.query(TestSession).filter(TestSession.id == session_id).one_or_none()
-        if not session:
-            return None
+        rendered = self.get_rendered_report(session_id)
+        return rendered[0] if rendered else None
 
+    def _render_telegram_report(self, session, answers_data) -> str:
         user: User = session.user
         intern: Intern = user.intern
 
@@ -94,23 +164,16 @@ class ReportingService:
         report_parts.append(header)
 
         # --- ВІДПОВІДІ ---
-        answers_data = self.db.query(UserAnswer).filter(UserAnswer.session_id == session_id).order_by(
-            UserAnswer.id).all()
-
         for i, answer in enumerate(answers_data, 1):
             question: Question = answer.question
-            selected_option: AnswerOption = answer.selected_option
-            correct_option: AnswerOption = (
-                self.db.query(AnswerOption)
-                .filter(AnswerOption.question_id == question.id, AnswerOption.is_correct == True)
-                .first()
-            )
+            selected_option: AnswerOption | None = answer.selected_option
+            correct_option: AnswerOption | None = answer.correct_option
 
             status_emoji = "🟢" if answer.is_correct else "🔴"
 
             detail = (
                 f"{status_emoji} *{i}\\. Питання:* {self._escape_md(question.text)}\n"
-                f"   \\- *Відповідь стажера:* {self._escape_md(selected_option.text)}\n"
+                f"   \\- *Відповідь стажера:* {self._escape_md(selected_option.text if selected_option else 'N/A')}\n"
                 f"   \\- *Статус:* {'✅ Правильно' if answer.is_correct else '❌ Неправильно'}\n"
                 f"   \\- *Правильний варіант:* {self._escape_md(correct_option.text if correct_option else 'N/A')}\n\n"
             )
@@ -123,10 +186,10 @@ class ReportingService:
         """
         Формує гарно структурований звіт для Google Doc.
         """
-        session = self.db.query(TestSession).filter(TestSession.id == session_id).one_or_none()
-        if not session:
-            return None
+        rendered = self.get_rendered_report(session_id)
+        return rendered[1] if rendered else None
 
+    def _render_doc_report(self, session, answers_data) -> str:
         user: User = session.user
         intern: Intern = user.intern
         intern_name = intern.full_name if intern else f"Користувач без профілю (ID: {user.telegram_id})"
@@ -157,15 +220,10 @@ class ReportingService:
         report_parts.append("━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n")
 
         # --- СПИСОК ПИТАНЬ ---
-        answers_data = self.db.query(UserAnswer).filter(UserAnswer.session_id == session_id).order_by(
-            UserAnswer.id).all()
-
         for i, answer in enumerate(answers_data, 1):
             question: Question = answer.question
-            selected_option: AnswerOption = answer.selected_option
-            correct_option: AnswerOption = self.db.query(AnswerOption).filter(
-                AnswerOption.question_id == question.id, AnswerOption.is_correct == True
-            ).first()
+            selected_option: AnswerOption | None = answer.selected_option
+            correct_option: AnswerOption | None = answer.correct_option
 
             status = '✅ ПРАВИЛЬНО' if answer.is_correct else '❌ НЕПРАВИЛЬНО'
 
@@ -175,7 +233,7 @@ class ReportingService:
                 f"🔹 Текст питання:\n"
                 f"   {question.text}\n\n"
                 f"🔹 Відповідь стажера:\n"
-                f"   {selected_option.text}\n\n"
+                f"   {selected_option.text if selected_option else 'N/A'}\n\n"
                 f"🔹 Правильний варіант:\n"
                 f"   {correct_option.text if correct_option else 'N/A'}\n\n"
                 f"🔹 Статус: {status}\n\n"
@@ -191,7 +249,7 @@ class ReportingService:
         Додає текст у кінець вказаного Google Doc.
         """
         if not self.docs_service:
-            print("❌ Google Docs Service не ініціалізовано. Пропуск запису.")
+            logger.error("❌ Google Docs Service не ініціалізовано. Пропуск запису.")
             return
 
         requests = [
@@ -207,21 +265,22 @@ class ReportingService:
             self.docs_service.documents().batchUpdate(
                 documentId=doc_id, body={'requests': requests}
             ).execute()
-            print(f"✅ Звіт успішно записано у Google Doc ID: {doc_id}")
+            logger.info(f"✅ Звіт успішно записано у Google Doc ID: {doc_id}")
         except HttpError as err:
-            print(f"❌ Помилка Google Docs API: {err}")
+            logger.error(f"❌ Помилка Google Docs API: {err}")
             raise
         except Exception as e:
-            print(f"❌ Невідома помилка при записі у Google Doc: {e}")
+            logger.error(f"❌ Невідома помилка при записі у Google Doc: {e}")
             raise
 
-    async def send_report_to_admin(self, session_id: int):
+    async def send_report_to_admin(self, session_id: int) -> bool:
         """
         Генерує звіт, надсилає його адміністратору (Telegram)
-        та записує його у Google Doc.
+        та записує його у Google Doc. Повертає False, якщо надіслати в Telegram не вдалося.
         """
-        telegram_report = self.generate_detailed_report(session_id)
-        doc_report = self._generate_report_for_doc(session_id)
+        # Обидві форми звіту рендеряться один раз і лишаються в кеші для /report
+        rendered = self.get_rendered_report(session_id)
+        telegram_report, doc_report = rendered if rendered else (None, None)
 
         try:
             admin_id = settings.ADMIN_CHAT_ID
@@ -230,32 +289,176 @@ class ReportingService:
 
         if telegram_report and admin_id:
             try:
-                # Переконуємось, що довжина звіту не перевищує ліміт Telegram
-                if len(telegram_report) > 4096:
-                    telegram_report = telegram_report[:4090] + "\n(...)"
-
-                await self.bot.send_message(
-                    chat_id=admin_id,
-                    text=telegram_report,
-                    parse_mode="MarkdownV2"
-                )
-                print(f"✅ Звіт про сесію {session_id} успішно надіслано адміністратору ({admin_id}).")
+                # Довгий звіт ділимо на кілька повідомлень (по межах рядків) замість обрізання
+                for part in split_message(telegram_report):
+                    await self.bot.send_message(
+                        chat_id=admin_id,
+                        text=part,
+                        parse_mode="MarkdownV2"
+                    )
+                logger.info(f"✅ Звіт про сесію {session_id} успішно надіслано адміністратору ({admin_id}).")
             except Exception as e:
-                print(f"❌ Помилка надсилання звіту адміністратору: {e}")
+                logger.error(f"❌ Помилка надсилання звіту адміністратору: {e}")
+                return False
 
         if doc_report and hasattr(settings, 'REPORT_DOC_ID') and settings.REPORT_DOC_ID:
             try:
                 await self._write_to_google_doc(settings.REPORT_DOC_ID, doc_report)
             except Exception as e:
-                print(f"❌ Не вдалося записати звіт у Google Doc: {e}")
+                logger.error(f"❌ Не вдалося записати звіт у Google Doc: {e}")
+        return True
+
+    def build_digest_summary(self, session_ids: list[int]) -> str:
+        """Коротка таблиця результатів: один рядок на стажера (звичайний текст)."""
+        sessions = (
+            self.db.query(TestSession)
+            .options(joinedload(TestSession.user).joinedload(User.intern))
+            .filter(TestSession.id.in_(session_ids))
+            .order_by(TestSession.end_time)
+            .all()
+        )
+        lines = [f"📊 Дайджест результатів: {len(sessions)} тест(ів)\n"]
+        for i, session in enumerate(sessions, 1):
+            intern = session.user.intern
+            name = intern.full_name if intern else f"ID {session.user.telegram_id}"
+            score = session.score or 0
+            max_score = session.max_score or 1
+            lines.append(f"{i}. {name} — {score}/{max_score} ({round(score / max_score * 100)}%)")
+        return "\n".join(lines)
+
+    async def send_digest(self, session_ids: list[int]) -> bool:
+        """
+        Надсилає адміністратору один дайджест за вікно: таблицю балів і файл
+        з повними звітами. Google Doc доповнюється одним batchUpdate.
+        Повертає False, якщо дайджест не доставлено в Telegram (тоді й Google Doc не чіпаємо,
+        щоб повторна відправка не дублювала звіти в документі).
+        """
+        summary = self.build_digest_summary(session_ids)
+        doc_reports = [report for report in map(self._generate_report_for_doc, session_ids) if report]
+        details = "\n\n".join(doc_reports)
+
+        admin_id = settings.ADMIN_CHAT_ID
+        if admin_id and doc_reports:
+            try:
+                document = BufferedInputFile(
+                    details.encode('utf-8'),
+                    filename=f"reports_{datetime.datetime.now().strftime('%Y%m%d_%H%M')}.txt"
+                )
+                if len(summary) <= TELEGRAM_CAPTION_LIMIT:
+                    # Зазвичай весь дайджест — це один виклик Bot API
+                    await self.bot.send_document(admin_id, document, caption=summary, parse_mode=None)
+                else:
+                    for part in split_message(summary):
+                        await self.bot.send_message(admin_id, part, parse_mode=None)
+                    await self.bot.send_document(admin_id, document, parse_mode=None)
+                logger.info(f"✅ Дайджест ({len(doc_reports)} звітів) надіслано адміністратору ({admin_id}).")
+            except Exception as e:
+                logger.error(f"❌ Помилка надсилання дайджесту адміністратору: {e}")
+                return False
+
+        if details and settings.REPORT_DOC_ID:
+            try:
+                await self._write_to_google_doc(settings.REPORT_DOC_ID, details)
+            except Exception as e:
+                logger.error(f"❌ Не вдалося записати дайджест у Google Doc: {e}")
+        return True
+
+
+# Префікс ключа /report для ID сесії: "s:1234". Без префікса ключ завжди трактується як ПІН,
+# бо ПІНи можуть бути числовими й збігатися з ID чужої сесії.
+REPORT_SESSION_PREFIX = 's:'
+
+
+def find_report_session_id(db: Session, key: str) -> int | None:
+    """
+    Визначає сесію для /report: "s:<ID сесії>" або ПІН стажера (остання завершена сесія,
+    у робочій таблиці чи в архіві).
+    """
+    if key.lower().startswith(REPORT_SESSION_PREFIX):
+        session_key = key[len(REPORT_SESSION_PREFIX):].strip()
+        if not session_key.isdigit():
+            return None
+        for session_model, _ in SESSION_SOURCES:
+            if db.query(session_model.id).filter(session_model.id == int(session_key)).first():
+                return int(session_key)
+        return None
+
+    user_id = (
+        db.query(User.id)
+        .join(Intern, User.intern_id == Intern.id)
+        .filter(func.lower(Intern.pin) == normalize_pin(key))
+        .scalar()
+    )
+    if user_id is None:
+        return None
+    for session_model, _ in SESSION_SOURCES:
+        session_id = (
+            db.query(session_model.id)
+            .filter(session_model.user_id == user_id, session_model.is_completed == True)
+            .order_by(session_model.end_time.desc())
+            .limit(1)
+            .scalar()
+        )
+        if session_id is not None:
+            return session_id
+    return None
+
+
+# Скільки сесій щонайбільше потрапляє в один дайджест (решта — у наступний)
+DIGEST_MAX_SESSIONS = 500
+
+
+def mark_reports_sent(session_ids: list[int]):
+    """Позначає звіти сесій доставленими (запис на основну БД)."""
+    with SessionLocal() as db:
+        db.execute(
+            update(TestSession).where(TestSession.id.in_(session_ids))
+            .values(report_sent_at=datetime.datetime.now())
+        )
+        db.commit()
+
+
+async def flush_report_digest(bot: Bot):
+    """
+    Надсилає дайджест за завершеними сесіями, звіт про які ще не доставлено (режим
+    REPORT_DIGEST_MINUTES > 0). Стан живе в БД (test_sessions.report_sent_at), а сесії
+    позначаються лише після доставки, тож перезапуск, деплой чи збій відправки не губить
+    звіти — вони потрапляють у наступний дайджест.
+    """
+    with SessionLocal() as db:
+        session_ids = db.scalars(
+            select(TestSession.id)
+            .where(TestSession.is_completed == True, TestSession.report_sent_at.is_(None))
+            .order_by(TestSession.end_time)
+            .limit(DIGEST_MAX_SESSIONS)
+        ).all()
+    if not session_ids:
+        return
+
+    # Звіти читаються з репліки, але лише після того, як вона побачить усі сесії вікна
+    delivered = False
+    for db in get_read_db(primary_wal_lsn()):
+        delivered = await ReportingService(db, bot).send_digest(session_ids)
+        break
+    if delivered:
+        mark_reports_sent(session_ids)
 
 
 # 🎯 Допоміжна функція
 async def finalise_session_and_report(session_id: int, bot: Bot):
     """
     Обгортка, що надає сесію БД, створює ReportingService та надсилає звіт.
+    У режимі дайджесту нічого не надсилає: завершена сесія без report_sent_at
+    сама потрапить у найближчий дайджест (flush_report_digest).
     """
-    for db in get_db():
+    if settings.REPORT_DIGEST_MINUTES > 0:
+        return
+
+    # Сесію щойно закомічено на основній БД — репліка має дійти до цієї позиції WAL
+    delivered = False
+    for db in get_read_db(primary_wal_lsn()):
         reporting_service = ReportingService(db, bot)
-        await reporting_service.send_report_to_admin(session_id)
-        break
\ No newline at end of file
+        delivered = await reporting_service.send_report_to_admin(session_id)
+        break
+    if delivered:
+        mark_reports_sent([session_id])
\ No newline at end of file
@@ -0,0 +1,83 @@
+# services/retention_service.py
+
+import datetime
+import logging
+
+from sqlalchemy import select, insert, delete
+from sqlalchemy.orm import Session
+
+from ..database.models import TestSession, UserAnswer, TestSessionArchive, UserAnswerArchive
+from .answer_storage import SessionAnswer, load_session_answers
+
+logger = logging.getLogger(__name__)
+
+# Колонки, що переносяться в архів (однакові назви в обох таблицях)
+SESSION_COLUMNS = ('id', 'user_id', 'start_time', 'end_time', 'score', 'max_score', 'is_completed', 'bank_id',
+                   'answer_question_ids', 'answer_option_ids', 'answer_correct')
+ANSWER_COLUMNS = ('id', 'session_id', 'question_id', 'selected_option_id', 'is_correct')
+
+# Пари (робоча таблиця, архів) — у такому порядку звіти шукають сесію
+SESSION_SOURCES = ((TestSession, UserAnswer), (TestSessionArchive, UserAnswerArchive))
+
+
+class RetentionService:
+    """
+    Переносить завершені сесії, старші за заданий вік, разом з відповідями
+    в архівні таблиці. Робочі test_sessions / user_answers лишаються малими,
+    тож запити гарячого шляху не сповільнюються з ростом історії.
+    """
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def archive_old_sessions(self, older_than_days: int, batch_size: int = 1000) -> int:
+        """
+        Архівує сесії пакетами по batch_size; кожен пакет — окрема транзакція
+        (INSERT ... SELECT в архів + DELETE з робочих таблиць). Повертає кількість сесій.
+        """
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+        archived = 0
+
+        while True:
+            session_ids = self.db.scalars(
+                select(TestSession.id)
+                .where(TestSession.is_completed == True, TestSession.end_time < cutoff)
+                .order_by(TestSession.id)
+                .limit(batch_size)
+            ).all()
+            if not session_ids:
+                break
+
+            try:
+                self.db.execute(insert(TestSessionArchive).from_select(
+                    SESSION_COLUMNS,
+                    select(*(getattr(TestSession, c) for c in SESSION_COLUMNS)).where(TestSession.id.in_(session_ids))
+                ))
+                self.db.execute(insert(UserAnswerArchive).from_select(
+                    ANSWER_COLUMNS,
+                    select(*(getattr(UserAnswer, c) for c in ANSWER_COLUMNS)).where(
+                        UserAnswer.session_id.in_(session_ids))
+                ))
+                self.db.execute(delete(UserAnswer).where(UserAnswer.session_id.in_(session_ids)))
+                self.db.execute(delete(TestSession).where(TestSession.id.in_(session_ids)))
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+
+            archived += len(session_ids)
+
+        logger.info(f"[Retention] Архівовано {archived} сесій, завершених до {cutoff:%Y-%m-%d}.")
+        return archived
+
+
+def find_session_with_answers(db: Session, session_id: int) -> tuple[object, list[SessionAnswer]]:
+    """
+    Знаходить сесію в робочій таблиці або в архіві.
+    Повертає (сесія, відповіді за порядком) або (None, []).
+    """
+    for session_model, answer_model in SESSION_SOURCES:
+        session = db.query(session_model).filter(session_model.id == session_id).one_or_none()
+        if session:
+            return session, load_session_answers(db, session, answer_model)
+    return None, []
@@ -0,0 +1,85 @@
+# services/stats_service.py
+
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+
+from ..database.models import Question, AnswerOption, QuestionStat, AnswerOptionStat, QuestionBank
+
+
+class QuestionStatsService:
+    """
+    Підтримує та читає інкрементні лічильники по питаннях і варіантах відповідей.
+    Запис — два атомарні upsert-и в транзакції відповіді; читання — O(кількості питань).
+    """
+
+    def __init__(self, db_session: Session):
+        self.db = db_session
+
+    def record_answer(self, question_id: int, option_id: int, is_correct: bool):
+        """
+        Збільшує лічильники для відповіді. НЕ робить commit — викликається
+        в тій самій транзакції, що й збереження UserAnswer.
+        """
+        correct_inc = 1 if is_correct else 0
+
+        question_stmt = insert(QuestionStat).values(
+            question_id=question_id, times_asked=1, times_correct=correct_inc
+        )
+        self.db.execute(question_stmt.on_conflict_do_update(
+            index_elements=[QuestionStat.question_id],
+            set_={
+                'times_asked': QuestionStat.times_asked + 1,
+                'times_correct': QuestionStat.times_correct + correct_inc,
+            }
+        ))
+
+        option_stmt = insert(AnswerOptionStat).values(
+            option_id=option_id, question_id=question_id, times_picked=1
+        )
+        self.db.execute(option_stmt.on_conflict_do_update(
+            index_elements=[AnswerOptionStat.option_id],
+            set_={'times_picked': AnswerOptionStat.times_picked + 1}
+        ))
+
+    def get_question_stats(self) -> list[dict]:
+        """
+        Повертає статистику по питаннях активної версії банку, від найскладнішого до найлегшого.
+        Питання, на які ще не відповідали, не включаються. Лічильники прив'язані до ID питання,
+        тож старі версії банку не дублюють у списку ті самі питання з частковими лічильниками.
+        """
+        rows = (
+            self.db.query(QuestionStat.question_id, Question.text, QuestionStat.times_asked, QuestionStat.times_correct)
+            .join(Question, Question.id == QuestionStat.question_id)
+            .join(QuestionBank, QuestionBank.id == Question.bank_id)
+            .filter(QuestionStat.times_asked > 0, QuestionBank.is_active == True)
+            .all()
+        )
+
+        option_rows = (
+            self.db.query(AnswerOptionStat.question_id, AnswerOption.text, AnswerOption.is_correct,
+                          AnswerOptionStat.times_picked)
+            .join(AnswerOption, AnswerOption.id == AnswerOptionStat.option_id)
+            .join(Question, Question.id == AnswerOptionStat.question_id)
+            .join(QuestionBank, QuestionBank.id == Question.bank_id)
+            .filter(QuestionBank.is_active == True)
+            .all()
+        )
+        picks_by_question: dict[int, list[dict]] = {}
+        for question_id, text, is_correct, times_picked in option_rows:
+            picks_by_question.setdefault(question_id, []).append(
+                {'text': text, 'is_correct': is_correct, 'times_picked': times_picked}
+            )
+
+        stats = []
+        for question_id, text, times_asked, times_correct in rows:
+            stats.append({
+                'question_id': question_id,
+                'text': text,
+                'times_asked': times_asked,
+                'times_correct': times_correct,
+                'correct_rate': times_correct / times_asked,
+                'option_picks': sorted(picks_by_question.get(question_id, []), key=lambda o: -o['times_picked']),
+            })
+
+        stats.sort(key=lambda s: s['correct_rate'])
+        return stats
@@ -1,8 +1,10 @@
+import logging
+import asyncio
 import datetime
 import os
 import random
 import re
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
 from aiogram import Bot, types
 from aiogram.fsm.context import FSMContext
@@ -11,10 +13,17 @@ from aiogram.fsm.storage.base import StorageKey
 
 # Імпорт моделей та станів
 # ПРИМІТКА: Змінено відносні імпорти на припущення про ваш кореневий каталог
-from ..database.models import User, Intern, Question, TestSession, AnswerOption, UserAnswer
+from ..database.models import (
+    User, Intern, Question, TestSession, AnswerOption, QuestionBank, TestSessionArchive
+)
 from ..core.states import TestingStates
 from ..database.session import get_db
 from ..core.config import settings
+from ..core.metrics import metrics
+from ..core.profiling import profiled
+from .answer_storage import count_answers, packed_fields
+
+logger = logging.getLogger(__name__)
 
 QUESTIONS_PER_TEST = 20
 
@@ -42,14 +51,29 @@ def escape_fixed_text(text: str) -> str:
     return text
 
 
+# Фіксовані повідомлення розсилки (екрануються один раз під час імпорту модуля)
+TEST_INTRO_TEXT = escape_fixed_text("🔔 **Час для фінального тестування!**\nВи отримаєте 20 питань. Успіху!")
+NOT_ENOUGH_QUESTIONS_TEXT = escape_fixed_text("На жаль, не вдалося розпочати тест: недостатньо питань у базі.")
+START_FAILED_TEXT = escape_fixed_text("⚠️ Виникла системна помилка при запуску тесту. Зверніться до адміністратора.")
+# Підтвердження попередньої відповіді над питанням у режимі "редагування на місці"
+ANSWER_SAVED_PREFIX = escape_fixed_text("✅ Відповідь збережено.") + "\n\n"
+
+
 class TestingService:
     def __init__(self, db_session: Session, bot: Bot):
         self.db = db_session
         self.bot = bot
 
-    def get_random_questions(self) -> list[Question]:
+    def get_active_bank_id(self) -> int | None:
+        """ID активної версії банку питань (None — банк ще не версіонувався)."""
+        return self.db.query(QuestionBank.id).filter(QuestionBank.is_active == True).scalar()
+
+    def get_random_questions(self, bank_id: int | None = None) -> list[Question]:
+        bank_filter = Question.bank_id == bank_id if bank_id is not None else Question.bank_id.is_(None)
         return (
             self.db.query(Question)
+            .options(selectinload(Question.options))
+            .filter(bank_filter)
             .order_by(func.random())
             .limit(QUESTIONS_PER_TEST)
             .all()
@@ -65,6 +89,11 @@ class TestingService:
             TestSession.user_id == user.id,
             TestSession.is_completed == True
         ).first()
+        if not completed_session:
+            # Тест одноразовий і для сесій, перенесених в архів
+            completed_session = self.db.query(TestSessionArchive.id).filter(
+                TestSessionArchive.user_id == user.id
+            ).first()
         if completed_session:
             # ВИПРАВЛЕНО: Використовуємо escape_fixed_text, щоб уникнути збою
             message = escape_fixed_text("❌ **Цей тест є одноразовим.** Ви вже його склали.")
@@ -73,11 +102,20 @@ class TestingService:
 
         active_session = self.db.query(TestSession).filter(
             TestSession.user_id == user.id,
-            TestSession.is_completed == False
+            TestSession.is_completed == False,
+            TestSession.is_pending == False
         ).order_by(TestSession.start_time.desc()).first()
         if active_session:
             return {'status': 'active', 'session': active_session}
 
+        # Сесія підготовлена заздалегідь, але тест ще не стартував
+        pending_session = self.db.query(TestSession).filter(
+            TestSession.user_id == user.id,
+            TestSession.is_pending == True
+        ).first()
+        if pending_session:
+            return {'status': 'pending', 'session': pending_session}
+
         return {'status': 'available', 'user_id': user.id}
 
     def finalize_test_session(self, session: TestSession):
@@ -85,10 +123,13 @@ class TestingService:
             session.is_completed = True
             session.end_time = datetime.datetime.now()
             self.db.commit()
-            print(f"✅ Сесія {session.id} завершена та зафіксована.")
+            logger.info(f"✅ Сесія {session.id} завершена та зафіксована.", extra={'session_id': session.id})
 
-    async def _send_next_question(self, user_id: int, fsm_context: FSMContext, session: TestSession,
-                                  question: Question):
+    def render_question(self, question: Question, number: int) -> dict:
+        """
+        Готує текст, клавіатуру та шлях до фото питання, нічого не надсилаючи.
+        Дозволяє відрендерити перше питання когорти заздалегідь.
+        """
         # --- 1. Варіанти відповіді ---
         options = random.sample(question.options, len(question.options))
         options_text = ""
@@ -106,8 +147,7 @@ class TestingService:
         keyboard = types.InlineKeyboardMarkup(inline_keyboard=buttons)
 
         # --- 3. Заголовок і текст питання ---
-        current_answer_count = self.db.query(UserAnswer).filter(UserAnswer.session_id == session.id).count()
-        header = f"**Питання {current_answer_count + 1}/{QUESTIONS_PER_TEST}:**"
+        header = f"**Питання {number}/{QUESTIONS_PER_TEST}:**"
 
         # Текст питання екрануємо суворо
         escaped_question_text = escape_markdown(question.text)
@@ -119,32 +159,195 @@ class TestingService:
             f"{options_text}"
         )
 
-        # --- 4. Відправка фото або тексту ---
-        photo_file_id = types.FSInputFile(question.photo_url) if question.photo_url and os.path.exists(
-            question.photo_url) else None
+        photo_path = question.photo_url if question.photo_url and os.path.exists(question.photo_url) else None
 
-        if photo_file_id:
+        return {'text': message_text, 'keyboard': keyboard, 'photo_path': photo_path}
+
+    async def send_rendered_question(self, user_id: int, rendered: dict):
+        """Надсилає заздалегідь відрендерене питання (фото або текст)."""
+        if rendered['photo_path']:
             await self.bot.send_photo(
                 chat_id=user_id,
-                photo=photo_file_id,
-                caption=message_text,
-                reply_markup=keyboard,
+                photo=types.FSInputFile(rendered['photo_path']),
+                caption=rendered['text'],
+                reply_markup=rendered['keyboard'],
                 parse_mode="MarkdownV2"
             )
         else:
             await self.bot.send_message(
                 chat_id=user_id,
-                text=message_text,
-                reply_markup=keyboard,
+                text=rendered['text'],
+                reply_markup=rendered['keyboard'],
                 parse_mode="MarkdownV2"
             )
 
-        # --- 5. Оновлення FSM ---
+    async def edit_question_in_place(self, message: types.Message, rendered: dict) -> bool:
+        """
+        Редагує повідомлення з попереднім питанням у наступне (edit_text або edit_media для фото).
+        Повертає False, якщо тип повідомлення не збігається (текст <-> фото) або Telegram відмовив.
+        """
+        text = ANSWER_SAVED_PREFIX + rendered['text']
+        try:
+            if rendered['photo_path'] and message.photo:
+                await message.edit_media(
+                    media=types.InputMediaPhoto(
+                        media=types.FSInputFile(rendered['photo_path']),
+                        caption=text,
+                        parse_mode="MarkdownV2"
+                    ),
+                    reply_markup=rendered['keyboard']
+                )
+            elif not rendered['photo_path'] and not message.photo:
+                await message.edit_text(text, reply_markup=rendered['keyboard'], parse_mode="MarkdownV2")
+            else:
+                return False
+        except Exception as e:
+            logger.warning(f"⚠️ Не вдалося відредагувати питання на місці: {e}")
+            return False
+
+        metrics.inc('question_edited_in_place')
+        return True
+
+    async def _send_next_question(self, user_id: int, fsm_context: FSMContext, session: TestSession,
+                                  question: Question):
+        current_answer_count = count_answers(self.db, session)
+        rendered = self.render_question(question, current_answer_count + 1)
+        await self.send_rendered_question(user_id, rendered)
+
+        # --- Оновлення FSM ---
         await fsm_context.set_state(TestingStates.in_test)
 
-    async def check_and_start_tests(self):
+    def _get_fsm_context(self, user_id: int) -> FSMContext:
+        storage = self.bot.storage if hasattr(self.bot,
+                                              'storage') and self.bot.storage is not None else MemoryStorage()
+        fsm_key = StorageKey(bot_id=self.bot.id, chat_id=user_id, user_id=user_id)
+        return FSMContext(storage=storage, key=fsm_key)
+
+    # ------------------------------------------------------------------
+    # Попередня підготовка когорти (до SCHEDULE_TIME)
+    # ------------------------------------------------------------------
+
+    @profiled()
+    async def prepare_cohort(self) -> dict:
+        """
+        Фаза підготовки: визначає стажерів на сьогодні, обирає питання, створює
+        сесії зі статусом is_pending та рендерить перше питання.
+        У момент запуску залишається лише розіслати повідомлення (release_cohort).
+        """
         today = datetime.date.today()
-        print(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Планувальник: Початок перевірки стажерів...")
+        cohort = {'date': today, 'sessions': [], 'notices': []}
+        logger.info(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Планувальник: Підготовка когорти...")
+
+        interns_to_test = (
+            self.db.query(Intern)
+            .filter(Intern.internship_end_date == today)
+            .join(User)
+            .all()
+        )
+        bank_id = self.get_active_bank_id()
+
+        for intern in interns_to_test:
+            user_id = intern.user.telegram_id
+            status_result = self.check_test_status(user_id)
+            status = status_result['status']
+
+            if status == 'completed':
+                cohort['notices'].append({'user_id': user_id, 'text': status_result['message']})
+                continue
+
+            if status in ('active', 'error'):
+                continue
+
+            test_questions = self.get_random_questions(bank_id)
+            if len(test_questions) < QUESTIONS_PER_TEST:
+                logger.error(f"Недостатньо питань у базі ({len(test_questions)}).")
+                cohort['notices'].append({'user_id': user_id, 'text': NOT_ENOUGH_QUESTIONS_TEXT})
+                continue
+
+            if status == 'pending':
+                # Залишок попередньої підготовки (напр. після перезапуску) — використовуємо повторно
+                session = status_result['session']
+                session.bank_id = bank_id
+            else:
+                session = TestSession(user_id=intern.user.id, max_score=QUESTIONS_PER_TEST, is_pending=True,
+                                      bank_id=bank_id, **packed_fields())
+                self.db.add(session)
+            self.db.flush()
+
+            cohort['sessions'].append({
+                'user_id': user_id,
+                'full_name': intern.full_name,
+                'session_id': session.id,
+                'questions_list': [q.id for q in test_questions],
+                'first_question': self.render_question(test_questions[0], 1),
+            })
+
+        # Усі підготовлені сесії фіксуємо однією транзакцією
+        self.db.commit()
+        logger.info(f"[Scheduler] Підготовлено {len(cohort['sessions'])} сесій, "
+                    f"{len(cohort['notices'])} сповіщень.")
+        return cohort
+
+    @profiled()
+    async def release_cohort(self, cohort: dict) -> set[int]:
+        """
+        Фаза запуску: активує підготовлені сесії одним UPDATE і паралельно
+        (з обмеженням PREWARM_SEND_CONCURRENCY) розсилає перші питання.
+        Повертає Telegram ID усіх оброблених стажерів.
+        """
+        session_ids = [entry['session_id'] for entry in cohort['sessions']]
+        if session_ids:
+            self.db.query(TestSession).filter(
+                TestSession.id.in_(session_ids),
+                TestSession.is_pending == True
+            ).update({'is_pending': False, 'start_time': datetime.datetime.now()}, synchronize_session=False)
+            self.db.commit()
+
+        semaphore = asyncio.Semaphore(settings.PREWARM_SEND_CONCURRENCY)
+
+        async def send_notice(notice: dict):
+            async with semaphore:
+                try:
+                    await self.bot.send_message(notice['user_id'], notice['text'], parse_mode="MarkdownV2")
+                except Exception as e:
+                    logger.error(f"Не вдалося надіслати сповіщення {notice['user_id']}: {e}")
+
+        async def release_session(entry: dict):
+            async with semaphore:
+                user_id = entry['user_id']
+                try:
+                    fsm_context = self._get_fsm_context(user_id)
+                    await fsm_context.set_data({
+                        'session_id': entry['session_id'],
+                        'questions_list': entry['questions_list'],
+                        'current_q_index': 0
+                    })
+                    await fsm_context.set_state(TestingStates.in_test)
+
+                    await self.bot.send_message(user_id, TEST_INTRO_TEXT, parse_mode="MarkdownV2")
+                    await self.send_rendered_question(user_id, entry['first_question'])
+                    logger.info(f"[SUCCESS] Запущено тест для {entry['full_name']} (ID: {entry['session_id']}).",
+                                extra={'session_id': entry['session_id'], 'user_id': user_id})
+                except Exception as e:
+                    logger.error(f"[FATAL ERROR] Не вдалося запустити тест для {entry['full_name']}: {e}",
+                                 extra={'session_id': entry['session_id'], 'user_id': user_id})
+                    try:
+                        await self.bot.send_message(user_id, START_FAILED_TEXT, parse_mode="MarkdownV2")
+                    except Exception:
+                        pass
+
+        await asyncio.gather(
+            *(send_notice(notice) for notice in cohort['notices']),
+            *(release_session(entry) for entry in cohort['sessions'])
+        )
+
+        return {entry['user_id'] for entry in cohort['sessions']} | {n['user_id'] for n in cohort['notices']}
+
+    @profiled()
+    async def check_and_start_tests(self, exclude_user_ids: set[int] | None = None):
+        exclude_user_ids = exclude_user_ids or set()
+        today = datetime.date.today()
+        logger.info(f"[{datetime.datetime.now().strftime('%H:%M:%S')}] Планувальник: Початок перевірки стажерів...")
 
         for db in get_db():
             interns_to_test = (
@@ -154,11 +357,13 @@ class TestingService:
                 .all()
             )
 
+            interns_to_test = [i for i in interns_to_test if i.user.telegram_id not in exclude_user_ids]
+
             if not interns_to_test:
-                print("   [Scheduler] Стажерів з датою закінчення сьогодні не знайдено.")
+                logger.info("[Scheduler] Стажерів з датою закінчення сьогодні не знайдено.")
                 return
 
-            print(f"   [Scheduler] Знайдено {len(interns_to_test)} стажерів для тестування.")
+            logger.info(f"[Scheduler] Знайдено {len(interns_to_test)} стажерів для тестування.")
 
             for intern in interns_to_test:
                 user_id = intern.user.telegram_id
@@ -166,7 +371,7 @@ class TestingService:
                 status = status_result['status']
 
                 if status == 'completed':
-                    print(f"      [SKIP] Стажер {intern.full_name} ВЖЕ завершив тест.")
+                    logger.info(f"[SKIP] Стажер {intern.full_name} ВЖЕ завершив тест.")
                     # Використовуємо повідомлення, яке вже було виправлено в check_test_status
                     await self.bot.send_message(
                         user_id,
@@ -176,47 +381,55 @@ class TestingService:
                     continue
 
                 if status == 'active':
-                    print(f"      [SKIP] Стажер {intern.full_name} має активну незавершену сесію.")
+                    logger.info(f"[SKIP] Стажер {intern.full_name} має активну незавершену сесію.")
                     continue
 
                 if status == 'error':
                     # ВИПРАВЛЕНО: Переконайтеся, що повідомлення з бази даних, якщо воно відправляється, екрановане.
                     # Оскільки тут відбувається `continue`, помилка не виникає.
-                    print(f"      [ERROR] Стажер {intern.full_name} не зареєстрований: {status_result['message']}")
+                    logger.error(f"Стажер {intern.full_name} не зареєстрований: {status_result['message']}")
                     continue
 
                 try:
-                    test_questions = self.get_random_questions()
+                    # Сесія прив'язується до версії банку, активної на момент старту
+                    bank_id = self.get_active_bank_id()
+                    test_questions = self.get_random_questions(bank_id)
                     if len(test_questions) < QUESTIONS_PER_TEST:
-                        print(f"      [ERROR] Недостатньо питань у базі ({len(test_questions)}).")
+                        logger.error(f"Недостатньо питань у базі ({len(test_questions)}).")
                         await self.bot.send_message(
                             user_id,
-                            escape_fixed_text("На жаль, не вдалося розпочати тест: недостатньо питань у базі."),
+                            NOT_ENOUGH_QUESTIONS_TEXT,
                             parse_mode="MarkdownV2"
                         )
                         continue
 
-                    new_session = TestSession(
-                        user_id=intern.user.id,
-                        max_score=QUESTIONS_PER_TEST,
-                        start_time=datetime.datetime.now()
-                    )
-                    db.add(new_session)
+                    if status == 'pending':
+                        # Підготовлена сесія, яку не було розіслано (напр. бот перезапускався)
+                        new_session = db.get(TestSession, status_result['session'].id)
+                        new_session.is_pending = False
+                        new_session.start_time = datetime.datetime.now()
+                        new_session.bank_id = bank_id
+                    else:
+                        new_session = TestSession(
+                            user_id=intern.user.id,
+                            max_score=QUESTIONS_PER_TEST,
+                            start_time=datetime.datetime.now(),
+                            bank_id=bank_id,
+                            **packed_fields()
+                        )
+                        db.add(new_session)
                     db.commit()
 
                     # ВИПРАВЛЕНО: Екранування фіксованого тексту
                     await self.bot.send_message(
                         user_id,
-                        escape_fixed_text("🔔 **Час для фінального тестування!**\nВи отримаєте 20 питань. Успіху!"),
+                        TEST_INTRO_TEXT,
                         parse_mode="MarkdownV2"
                     )
 
                     questions_id_list = [q.id for q in test_questions]
 
-                    storage = self.bot.storage if hasattr(self.bot,
-                                                          'storage') and self.bot.storage is not None else MemoryStorage()
-                    fsm_key = StorageKey(bot_id=self.bot.id, chat_id=user_id, user_id=user_id)
-                    fsm_context = FSMContext(storage=storage, key=fsm_key)
+                    fsm_context = self._get_fsm_context(user_id)
 
                     await fsm_context.set_data({
                         'session_id': new_session.id,
@@ -228,15 +441,16 @@ class TestingService:
                     first_question = db.query(Question).get(questions_id_list[0])
                     await self._send_next_question(user_id, fsm_context, new_session, first_question)
 
-                    print(f"      [SUCCESS] Запущено тест для {intern.full_name} (ID: {new_session.id}).")
+                    logger.info(f"[SUCCESS] Запущено тест для {intern.full_name} (ID: {new_session.id}).",
+                                extra={'session_id': new_session.id, 'user_id': user_id})
 
                 except Exception as e:
-                    print(f"      [FATAL ERROR] Не вдалося запустити тест для {intern.full_name}: {e}")
+                    logger.error(f"[FATAL ERROR] Не вдалося запустити тест для {intern.full_name}: {e}",
+                                 extra={'user_id': user_id})
                     # ВИПРАВЛЕНО: Екранування фіксованого тексту
                     await self.bot.send_message(
                         user_id,
-                        escape_fixed_text(
-                            "⚠️ Виникла системна помилка при запуску тесту. Зверніться до адміністратора."),
+                        START_FAILED_TEXT,
                         parse_mode="MarkdownV2"
                     )
 
@@ -244,8 +458,20 @@ class TestingService:
 class TestingSchedulerWrapper:
     def __init__(self, bot: Bot):
         self.bot = bot
+        # Когорта, підготовлена prepare_scheduled_tests до моменту запуску
+        self.prepared_cohort: dict | None = None
+
+    async def prepare_scheduled_tests(self):
+        for db in get_db():
+            service = TestingService(db, self.bot)
+            self.prepared_cohort = await service.prepare_cohort()
 
     async def run_scheduled_tests(self):
+        cohort, self.prepared_cohort = self.prepared_cohort, None
         for db in get_db():
             service = TestingService(db, self.bot)
-            await service.check_and_start_tests()
\ No newline at end of file
+            released_user_ids = set()
+            if cohort and cohort['date'] == datetime.date.today():
+                released_user_ids = await service.release_cohort(cohort)
+            # Дозапуск для тих, хто не потрапив у підготовку (напр. зареєструвався пізніше)
+            await service.check_and_start_tests(exclude_user_ids=released_user_ids)
\ No newline at end of file
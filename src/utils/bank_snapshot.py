@@ -0,0 +1,129 @@
+import datetime
+import logging
+import os
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..database.models import Question, AnswerOption, QuestionBank
+
+# Знімок зберігається у форматі Arrow IPC (опційна залежність pyarrow).
+# Без неї бот працює як раніше — лише з банком у БД.
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:
+    pa = None
+    ipc = None
+
+logger = logging.getLogger(__name__)
+
+# Версія формату файлу: знімок іншої версії ігнорується
+SNAPSHOT_FORMAT_VERSION = "1"
+
+
+def _schema():
+    return pa.schema([
+        ('text', pa.string()),
+        # Лише ім'я файлу: директорія фото береться з PHOTO_DIR під час завантаження
+        ('photo_file', pa.string()),
+        ('option_texts', pa.list_(pa.string())),
+        ('option_correct', pa.list_(pa.bool_())),
+    ])
+
+
+def write_snapshot(questions: list[dict], path: str | None = None) -> bool:
+    """
+    Записує розібраний банк (питання, варіанти, правильність, фото) у локальний файл.
+    questions — список {'text', 'photo_path', 'options': [{'text', 'is_correct'}]}.
+    Файл замінюється атомарно, тож читач ніколи не бачить недописаний знімок.
+    """
+    if pa is None:
+        return False
+    path = path or settings.QUESTION_SNAPSHOT_PATH
+    table = pa.Table.from_pydict({
+        'text': [q['text'] for q in questions],
+        'photo_file': [os.path.basename(q['photo_path']) if q['photo_path'] else None for q in questions],
+        'option_texts': [[o['text'] for o in q['options']] for q in questions],
+        'option_correct': [[o['is_correct'] for o in q['options']] for q in questions],
+    }, schema=_schema().with_metadata({
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'created_at': datetime.datetime.now().isoformat(timespec='seconds'),
+    }))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink, ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    logger.info(f"[Snapshot] Знімок банку ({len(questions)} питань) збережено у {path}.")
+    return True
+
+
+def read_snapshot(path: str | None = None) -> tuple[dict, list[dict]] | None:
+    """
+    Читає знімок через memory map (без копіювання файлу в пам'ять).
+    Повертає (метадані, питання) або None, якщо знімка немає чи він іншої версії.
+    """
+    path = path or settings.QUESTION_SNAPSHOT_PATH
+    if pa is None or not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, 'r') as source:
+            table = ipc.open_file(source).read_all()
+    except Exception as e:
+        logger.warning(f"[Snapshot] Не вдалося прочитати знімок {path}: {e}")
+        return None
+
+    metadata = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+    if metadata.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        logger.warning(f"[Snapshot] Знімок {path} має іншу версію формату — ігнорується.")
+        return None
+
+    questions = []
+    for row in table.to_pylist():
+        photo_path = os.path.join(settings.PHOTO_DIR, row['photo_file']) if row['photo_file'] else None
+        questions.append({
+            'text': row['text'],
+            'photo_path': photo_path if photo_path and os.path.exists(photo_path) else None,
+            'options': [{'text': t, 'is_correct': c} for t, c in zip(row['option_texts'], row['option_correct'])],
+        })
+    return metadata, questions
+
+
+def restore_bank_from_snapshot(db: Session) -> int | None:
+    """
+    Якщо в БД немає активного банку (нова база, збій імпорту), відновлює його зі знімка
+    без звернення до Google. Повертає ID відновленої версії банку або None.
+    """
+    if db.query(QuestionBank.id).filter(QuestionBank.is_active == True).first():
+        return None
+    snapshot = read_snapshot()
+    if snapshot is None:
+        return None
+    metadata, questions = snapshot
+
+    try:
+        bank = QuestionBank(is_active=False, question_count=len(questions))
+        db.add(bank)
+        db.flush()
+        db.add_all([
+            Question(
+                text=q['text'],
+                photo_url=q['photo_path'],
+                photo_size=os.path.getsize(q['photo_path']) if q['photo_path'] else None,
+                bank_id=bank.id,
+                options=[AnswerOption(text=o['text'], is_correct=o['is_correct']) for o in q['options']],
+            )
+            for q in questions
+        ])
+        db.execute(update(QuestionBank).values(is_active=(QuestionBank.id == bank.id)))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    logger.info(f"[Snapshot] Банк №{bank.id} ({len(questions)} питань) відновлено зі знімка "
+                f"від {metadata.get('created_at')}.")
+    return bank.id
@@ -1,8 +1,11 @@
+import hashlib
+import logging
 import os
 import re
 import requests
 import json
-from typing import Any
+from typing import Any, Iterator
+from sqlalchemy import update, exists, select, insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from googleapiclient.errors import HttpError
@@ -10,8 +13,15 @@ from google.oauth2.service_account import Credentials
 from googleapiclient.discovery import build
 
 from ..core.config import settings
-from ..database.models import Question, AnswerOption, UserAnswer  # ❗️ ДОДАНО UserAnswer
+from ..database.models import (
+    Question, AnswerOption, UserAnswer, QuestionStat, AnswerOptionStat, QuestionBank, TestSession,
+    TestSessionArchive, UserAnswerArchive
+)
 from .google_sheet_importer import ImportError
+from .image_pipeline import normalize_image, NORMALIZED_EXTENSION
+from .bank_snapshot import write_snapshot
+
+logger = logging.getLogger(__name__)
 
 # Регулярний вираз для очищення тексту питання від нумерації типу "1. ", "2.", "Q: "
 QUESTION_START_REGEX = re.compile(r'^\s*(\d+\.?\s*|Q\s*:\s*)?')
@@ -19,6 +29,24 @@ QUESTION_START_REGEX = re.compile(r'^\s*(\d+\.?\s*|Q\s*:\s*)?')
 # 🎯 ФРАЗА ДЛЯ ІГНОРУВАННЯ
 EXCLUDED_PHRASE = "До якого типу відноситься цей пристрій для паріння?"
 
+# Маска часткової відповіді Docs API: без стилів документа, списків, розмітки сторінок тощо
+DOCUMENT_FIELDS = (
+    "body/content/paragraph/elements(textRun(content,textStyle/foregroundColor),inlineObjectElement/inlineObjectId),"
+    "inlineObjects"
+)
+
+
+def questions_content_hash(questions: list[dict]) -> str:
+    """
+    Хеш змісту розібраного документа (тексти, варіанти, правильність, ID зображень).
+    Однаковий хеш з активною версією банку означає, що документ не змінився.
+    """
+    payload = [
+        [q['text'], q['image_id'], [[opt['text'], opt['is_correct']] for opt in q['options']]]
+        for q in questions
+    ]
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode('utf-8')).hexdigest()
+
 
 class GoogleDocsImporter:
     """
@@ -38,6 +66,10 @@ class GoogleDocsImporter:
         self.drive_service = build('drive', 'v3', credentials=self.creds)
         os.makedirs(settings.PHOTO_DIR, exist_ok=True)
 
+        # Лічильники розміру фото за імпорт (до / після нормалізації)
+        self.photo_bytes_original = 0
+        self.photo_bytes_final = 0
+
     # ------------------- допоміжні методи -------------------
 
     def _is_green(self, rgb_color: dict) -> bool:
@@ -46,97 +78,79 @@ class GoogleDocsImporter:
             return g > 0.15 and g > r + 0.1 and g > b + 0.1
         return False
 
-    def _download_image(self, file_id: str, file_extension: str = 'png') -> str | None:
+    def _download_image(self, file_id: str) -> str | None:
         try:
             if self.creds.expired and self.creds.refresh_token:
                 self.creds.refresh(requests.Request())
 
             download_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-            filename = f"q_{file_id}.{file_extension}"
-            filepath = os.path.join(settings.PHOTO_DIR, filename)
             headers = {'Authorization': f'Bearer {self.creds.token}'}
 
-            response = requests.get(download_url, headers=headers, stream=True)
+            response = requests.get(download_url, headers=headers)
             response.raise_for_status()
+            original = response.content
+
+            # Нормалізуємо під Telegram (розмір, JPEG, без метаданих); якщо не вийшло
+            # або результат більший — зберігаємо оригінал
+            normalized = normalize_image(original)
+            if normalized is not None and len(normalized) < len(original):
+                data, file_extension = normalized, NORMALIZED_EXTENSION
+            else:
+                data, file_extension = original, 'png'
 
+            filename = f"q_{file_id}.{file_extension}"
+            filepath = os.path.join(settings.PHOTO_DIR, filename)
             with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+                f.write(data)
 
-            print(f"      [DRIVE SUCCESS] Зображення {file_id} збережено як {filename}")
+            self.photo_bytes_original += len(original)
+            self.photo_bytes_final += len(data)
+            logger.info(f"[DRIVE SUCCESS] Зображення {file_id} збережено як {filename} "
+                        f"({len(original)} -> {len(data)} байт)")
             return filepath
         except Exception as e:
-            print(f"      [DOWNLOAD ERROR] Невідома помилка завантаження {file_id}: {e}")
+            logger.error(f"[DOWNLOAD ERROR] Невідома помилка завантаження {file_id}: {e}")
             return None
 
-    def _extract_text_content_and_style(self, element: Any, document: Any) -> tuple[str, bool, str | None]:
-        text_content, is_correct_style, image_id = "", False, None
+    def _extract_text_content_and_style(self, element: Any, image_ids: dict[str, str]) -> tuple[str, bool, str | None]:
+        text_parts, is_correct_style, image_id = [], False, None
         if 'paragraph' in element:
             for elem in element.get('paragraph').get('elements', []):
                 if 'textRun' in elem:
                     text_run = elem.get('textRun', {})
-                    text_content += text_run.get('content', '')
+                    text_parts.append(text_run.get('content', ''))
                     rgb = text_run.get('textStyle', {}).get('foregroundColor', {}).get('color', {}).get('rgbColor', {})
                     if self._is_green(rgb):
                         is_correct_style = True
                 elif 'inlineObjectElement' in elem:
-                    inline_obj_id = elem['inlineObjectElement']['inlineObjectId']
-                    embedded_object = document.get('inlineObjects', {}).get(inline_obj_id, {}).get(
-                        'inlineObjectProperties', {}).get('embeddedObject', {})
-                    if 'imageProperties' in embedded_object:
-                        content_uri = embedded_object['imageProperties'].get('contentUri')
-                        if content_uri:
-                            match = re.search(r'(?:id=|/d/)([a-zA-Z0-9_-]+)', content_uri)
-                            if match:
-                                image_id = match.group(1)
-            text_content = text_content.replace('\xa0', ' ').strip()
-        return text_content, is_correct_style, image_id
-
-    def _save_question_to_db(self, db: Session, q_text: str, photo_path: str | None, options: list):
-        try:
-            current_question = Question(text=q_text, photo_url=photo_path)
-            db.add(current_question)
-            db.flush()
-            if not any(opt['is_correct'] for opt in options):
-                print(f"      [WARNING] Питання '{q_text[:50]}...' не має правильної відповіді.")
-            for opt in options:
-                db.add(AnswerOption(question_id=current_question.id, text=opt['text'], is_correct=opt['is_correct']))
-        except Exception as e:
-            print(f"      [ERROR] Помилка збереження питання '{q_text[:30]}...': {e}")
+                    image_id = image_ids.get(elem['inlineObjectElement']['inlineObjectId'], image_id)
+        return ''.join(text_parts).replace('\xa0', ' ').strip(), is_correct_style, image_id
 
-    # ------------------- основний метод імпорту -------------------
+    @staticmethod
+    def _collect_image_ids(document: Any) -> dict[str, str]:
+        """Один прохід по inlineObjects: ID вбудованого об'єкта -> ID файлу зображення на Drive."""
+        image_ids = {}
+        for inline_obj_id, inline_obj in document.get('inlineObjects', {}).items():
+            embedded_object = inline_obj.get('inlineObjectProperties', {}).get('embeddedObject', {})
+            content_uri = embedded_object.get('imageProperties', {}).get('contentUri')
+            if content_uri:
+                match = re.search(r'(?:id=|/d/)([a-zA-Z0-9_-]+)', content_uri)
+                if match:
+                    image_ids[inline_obj_id] = match.group(1)
+        return image_ids
 
-    def import_questions(self, db: Session):
-        print("      [Importer] Початок імпорту питань з Google Docs...")
-        try:
-            document = self.docs_service.documents().get(documentId=settings.QUESTION_DOC_ID).execute()
-        except HttpError as e:
-            raise ImportError(f"Помилка доступу до Google Docs: {e}.")
+    def iter_questions(self, document: Any) -> Iterator[dict]:
+        """
+        Однопрохідний розбір документа (скінченний автомат по абзацах).
+        Віддає питання {'text', 'image_id', 'options': [{'text', 'is_correct'}]} одразу,
+        щойно воно завершилося, не накопичуючи весь банк у пам'яті.
+        """
+        image_ids = self._collect_image_ids(document)
+        question_parts, current_options, current_image_id = None, [], None
+        is_ignoring_block = False
 
-        # ❗️❗️❗️ ОСЬ ЗМІНА ❗️❗️❗️
-        # Очищення таблиць перед імпортом у правильному порядку
-        try:
-            # 1. Спочатку видаляємо залежні записи (відповіді користувачів)
-            db.query(UserAnswer).delete(synchronize_session=False)
-
-            # 2. Потім видаляємо основні записи (варіанти відповідей)
-            db.query(AnswerOption).delete(synchronize_session=False)
-
-            # 3. І наостанок - самі питання
-            db.query(Question).delete(synchronize_session=False)
-
-            db.commit()
-            print("      [INFO] Старі результати, питання та варіанти видалено.")
-        except Exception as e:
-            db.rollback()
-            print(f"      [WARNING] Не вдалося очистити таблиці: {e}")
-
-        elements = document.get('body', {}).get('content', [])
-        current_question_text, current_options, current_image_id = None, [], None
-        question_count, is_ignoring_block = 0, False
-
-        for element in elements:
-            text_content, is_correct, element_image_id = self._extract_text_content_and_style(element, document)
+        for element in document.get('body', {}).get('content', []):
+            text_content, is_correct, element_image_id = self._extract_text_content_and_style(element, image_ids)
             if element_image_id:
                 current_image_id = element_image_id
             if not text_content:
@@ -145,31 +159,149 @@ class GoogleDocsImporter:
             if text_content.endswith(':'):
                 if EXCLUDED_PHRASE in text_content:
                     is_ignoring_block = True
-                    current_question_text = None
+                    question_parts = None
                     continue
-                if current_question_text and current_options:
-                    photo_path = self._download_image(current_image_id) if current_image_id else None
-                    self._save_question_to_db(db, current_question_text, photo_path, current_options)
-                    question_count += 1
-                current_question_text = QUESTION_START_REGEX.sub('', text_content).strip()
+                if question_parts and current_options:
+                    yield {'text': ' '.join(question_parts), 'image_id': current_image_id, 'options': current_options}
+                question_text = QUESTION_START_REGEX.sub('', text_content).strip()
+                question_parts = [question_text] if question_text else None
                 current_options, current_image_id, is_ignoring_block = [], element_image_id, False
             elif is_ignoring_block:
                 continue
-            elif current_question_text and text_content.startswith('-'):
+            elif question_parts and text_content.startswith('-'):
                 option_text = text_content.lstrip('-').strip()
                 if option_text:
                     current_options.append({'text': option_text, 'is_correct': is_correct})
-            elif current_question_text:
-                current_question_text = (current_question_text + " " + text_content).strip()
+            elif question_parts:
+                question_parts.append(text_content)
+
+        if question_parts and current_options and not is_ignoring_block:
+            yield {'text': ' '.join(question_parts), 'image_id': current_image_id, 'options': current_options}
+
+    def _save_questions_bulk(self, db: Session, bank_id: int, questions: list[dict]):
+        """
+        Записує всю версію банку двома пакетними запитами (без commit):
+        питання з RETURNING id, потім усі варіанти відповіді одним insert.
+        """
+        rows = []
+        for q in questions:
+            if not any(opt['is_correct'] for opt in q['options']):
+                logger.warning(f"Питання '{q['text'][:50]}...' не має правильної відповіді.")
+            rows.append({
+                'text': q['text'],
+                'photo_url': q['photo_path'],
+                'photo_size': os.path.getsize(q['photo_path']) if q['photo_path'] else None,
+                'bank_id': bank_id,
+            })
 
-        if current_question_text and current_options and not is_ignoring_block:
-            photo_path = self._download_image(current_image_id) if current_image_id else None
-            self._save_question_to_db(db, current_question_text, photo_path, current_options)
-            question_count += 1
+        # sort_by_parameter_order гарантує, що i-й ID відповідає i-му питанню
+        question_ids = db.scalars(
+            insert(Question).returning(Question.id, sort_by_parameter_order=True), rows
+        ).all()
+        db.execute(insert(AnswerOption), [
+            {'question_id': question_id, 'text': opt['text'], 'is_correct': opt['is_correct']}
+            for question_id, q in zip(question_ids, questions)
+            for opt in q['options']
+        ])
 
+    # ------------------- основний метод імпорту -------------------
+
+    def import_questions(self, db: Session):
+        logger.info("[Importer] Початок імпорту питань з Google Docs...")
         try:
+            # Лише поля, які читає парсер: текст і колір абзаців та посилання на зображення
+            document = self.docs_service.documents().get(
+                documentId=settings.QUESTION_DOC_ID, fields=DOCUMENT_FIELDS
+            ).execute()
+        except HttpError as e:
+            raise ImportError(f"Помилка доступу до Google Docs: {e}.")
+
+        questions = list(self.iter_questions(document))
+        question_count = len(questions)
+        if question_count == 0:
+            # Порожній документ не повинен підміняти робочий банк
+            raise ImportError("У документі не знайдено жодного питання. Активну версію банку залишено без змін.")
+
+        # Документ не змінився — лишаємо активну версію: ID питань (а з ними статистика
+        # та аналіз питань) не розпорошуються по новій версії після кожного щоденного імпорту.
+        content_hash = questions_content_hash(questions)
+        active_bank_id = db.query(QuestionBank.id).filter(
+            QuestionBank.is_active == True, QuestionBank.content_hash == content_hash
+        ).scalar()
+        if active_bank_id is not None:
+            logger.info(f"[Importer] Документ не змінився — активна версія банку №{active_bank_id} без змін.")
+            return
+
+        # Нова версія банку будується поруч із поточною; живі тести її не бачать,
+        # доки в кінці імпорту не буде перемкнуто is_active (в тій самій транзакції).
+        bank = QuestionBank(is_active=False, content_hash=content_hash)
+        db.add(bank)
+        db.flush()
+        logger.info(f"Будується версія банку питань №{bank.id}.")
+
+        # Розібрані питання (з локальними шляхами фото) — для пакетного запису та знімка банку
+        parsed_questions = []
+        for question in questions:
+            photo_path = self._download_image(question['image_id']) if question['image_id'] else None
+            parsed_questions.append({'text': question['text'], 'photo_path': photo_path, 'options': question['options']})
+
+        try:
+            self._save_questions_bulk(db, bank.id, parsed_questions)
+            bank.question_count = question_count
+            # Атомарне перемикання: одна версія стає активною, решта — неактивними
+            db.execute(update(QuestionBank).values(is_active=(QuestionBank.id == bank.id)))
             db.commit()
-            print(f"      [Importer] Успішно імпортовано {question_count} питань.")
+            logger.info(f"[Importer] Успішно імпортовано {question_count} питань. Активна версія банку: №{bank.id}.")
+            if self.photo_bytes_original:
+                saved = self.photo_bytes_original - self.photo_bytes_final
+                logger.info(f"[Importer] Фото: {self.photo_bytes_original} -> {self.photo_bytes_final} байт "
+                            f"(заощаджено {saved} байт, {saved / self.photo_bytes_original:.1%}).")
         except IntegrityError as e:
             db.rollback()
-            raise ImportError(f"Помилка цілісності БД при імпорті питань: {e}")
\ No newline at end of file
+            raise ImportError(f"Помилка цілісності БД при імпорті питань: {e}")
+
+        # Знімок дозволяє наступному старту обійтися без Google (див. bank_snapshot)
+        try:
+            write_snapshot(parsed_questions)
+        except Exception as e:
+            logger.warning(f"[Importer] Не вдалося зберегти знімок банку: {e}")
+
+        self._prune_unused_banks(db)
+
+    def _prune_unused_banks(self, db: Session):
+        """
+        Видаляє неактивні версії банку, на які не посилається жодна сесія.
+        Версії з сесіями зберігаються, щоб звіти та незавершені тести мали свої питання.
+        """
+        try:
+            used_by_sessions = exists().where(TestSession.bank_id == QuestionBank.id)
+            used_by_answers = exists().where(
+                UserAnswer.question_id == Question.id, Question.bank_id == QuestionBank.id
+            )
+            used_by_archive = exists().where(TestSessionArchive.bank_id == QuestionBank.id)
+            used_by_archived_answers = exists().where(
+                UserAnswerArchive.question_id == Question.id, Question.bank_id == QuestionBank.id
+            )
+            stale_bank_ids = db.scalars(
+                select(QuestionBank.id).where(
+                    QuestionBank.is_active == False, ~used_by_sessions, ~used_by_answers,
+                    ~used_by_archive, ~used_by_archived_answers
+                )
+            ).all()
+            if not stale_bank_ids:
+                return
+
+            question_ids = select(Question.id).where(Question.bank_id.in_(stale_bank_ids))
+            db.query(AnswerOptionStat).filter(AnswerOptionStat.question_id.in_(question_ids)).delete(
+                synchronize_session=False)
+            db.query(QuestionStat).filter(QuestionStat.question_id.in_(question_ids)).delete(
+                synchronize_session=False)
+            db.query(AnswerOption).filter(AnswerOption.question_id.in_(question_ids)).delete(
+                synchronize_session=False)
+            db.query(Question).filter(Question.bank_id.in_(stale_bank_ids)).delete(synchronize_session=False)
+            db.query(QuestionBank).filter(QuestionBank.id.in_(stale_bank_ids)).delete(synchronize_session=False)
+            db.commit()
+            logger.info(f"Видалено невикористані версії банку: {stale_bank_ids}.")
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Не вдалося прибрати старі версії банку: {e}")
\ No newline at end of file
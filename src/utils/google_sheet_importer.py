@@ -1,11 +1,12 @@
+import logging
 import gspread
 import os
-import re
-import requests
 import json
-import traceback  # ❗️ ДОДАНО: Для детального звіту про помилки
-from datetime import datetime, timedelta
-from typing import Callable, Any
+from datetime import datetime
+from typing import Callable
+
+import pandas as pd
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from google.oauth2 import service_account
@@ -15,6 +16,9 @@ from googleapiclient.errors import HttpError
 from ..core.config import settings
 from ..database.models import Intern
 from ..database.session import get_db
+from ..services.registration_service import invalidate_registration_cache
+
+logger = logging.getLogger(__name__)
 
 
 class ImportError(Exception):
@@ -22,6 +26,55 @@ class ImportError(Exception):
     pass
 
 
+# Діапазони аркуша стажерів: B — дата закінчення стажування, D — ПІН, E — ПІБ (рядок 1 — заголовок)
+INTERN_DATE_RANGE = 'B2:B'
+INTERN_PIN_NAME_RANGE = 'D2:E'
+FIRST_DATA_ROW = 2
+
+# Текстові формати дати (перевіряються по черзі); ціле число — серійна дата Google Sheets/Excel
+INTERN_DATE_FORMATS = ['%d.%m.%Y %H:%M:%S', '%d.%m.%Y', '%Y-%m-%d']
+SERIAL_DATE_ORIGIN = '1899-12-30'
+
+
+def parse_intern_block(dates: list[str], pins: list[str], names: list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Векторно розбирає блок аркуша стажерів.
+    Повертає (коректні рядки: row_number, pin, full_name, internship_end_date;
+    відхилені рядки: row_number, date, pin, full_name, reason).
+    Повністю порожні рядки ігноруються.
+    """
+    frame = pd.DataFrame({'date': dates, 'pin': pins, 'full_name': names}, dtype='string').fillna('')
+    frame.insert(0, 'row_number', range(FIRST_DATA_ROW, FIRST_DATA_ROW + len(frame)))
+    frame['date'] = frame['date'].str.strip()
+    frame['pin'] = frame['pin'].str.replace(r'\s+', '', regex=True)
+    frame['full_name'] = frame['full_name'].str.strip()
+    frame = frame[(frame['date'] != '') | (frame['pin'] != '') | (frame['full_name'] != '')]
+
+    # Дата: спершу серійні числа, потім кожен текстовий формат — по одному проходу на весь стовпець
+    is_serial = frame['date'].str.fullmatch(r'\d+')
+    parsed = pd.to_datetime(
+        pd.to_numeric(frame['date'].where(is_serial), errors='coerce'),
+        unit='D', origin=SERIAL_DATE_ORIGIN, errors='coerce'
+    )
+    for fmt in INTERN_DATE_FORMATS:
+        parsed = parsed.fillna(pd.to_datetime(frame['date'].where(~is_serial), format=fmt, errors='coerce'))
+    frame['internship_end_date'] = parsed.dt.date
+
+    reason = pd.Series(pd.NA, index=frame.index, dtype='string')
+    missing = (frame['date'] == '') | (frame['pin'] == '') | (frame['full_name'] == '')
+    reason[missing] = 'відсутні дані'
+    reason[~missing & parsed.isna()] = 'невірний формат дати'
+    # Дублікат ПІН серед коректних рядків: діє останній рядок (як і раніше при оновленні).
+    # Порівнюємо без урахування регістру — так ПІН шукається при реєстрації (lower(pin)).
+    valid_mask = reason.isna()
+    duplicated = valid_mask & frame['pin'].str.lower().where(valid_mask).duplicated(keep='last')
+    reason[duplicated] = 'дублікат ПІН (діє нижчий рядок)'
+
+    valid = frame[reason.isna()][['row_number', 'pin', 'full_name', 'internship_end_date']]
+    rejected = frame[reason.notna()][['row_number', 'date', 'pin', 'full_name']].assign(reason=reason[reason.notna()])
+    return valid, rejected
+
+
 # --------------------------------------------------------------------------------
 # КЛАС ІМПОРТУ
 # --------------------------------------------------------------------------------
@@ -66,85 +119,78 @@ class GoogleSheetImporter:
         """
         Імпортує дані стажерів з Google Sheets.
         """
-        print("      [Importer] Початок імпорту даних стажерів...")
+        logger.info("[Importer] Початок імпорту даних стажерів...")
 
         try:
             sheet = self.gspread_client.open_by_key(settings.INTERN_SHEET_ID)
             try:
                 worksheet = sheet.worksheet(settings.INTERN_WORKSHEET_NAME)
-                print(f"      [INFO] Використовується аркуш: '{settings.INTERN_WORKSHEET_NAME}'")
+                logger.info(f"Використовується аркуш: '{settings.INTERN_WORKSHEET_NAME}'")
             except gspread.WorksheetNotFound:
-                print(
-                    f"      [WARNING] Аркуш з назвою '{settings.INTERN_WORKSHEET_NAME}' не знайдено. Спроба взяти перший аркуш.")
+                logger.warning(
+                    f"[WARNING] Аркуш з назвою '{settings.INTERN_WORKSHEET_NAME}' не знайдено. Спроба взяти перший аркуш.")
                 worksheet = sheet.get_worksheet(0)
 
-            all_data = worksheet.get_all_values()
-            data = all_data[1:]
+            # Лише потрібні стовпці (B, D, E), а не весь аркуш
+            date_range, pin_name_range = worksheet.batch_get([INTERN_DATE_RANGE, INTERN_PIN_NAME_RANGE])
 
         except Exception as e:
             raise ImportError(f"Помилка читання даних стажерів з Google Sheets: {e}")
 
-        imported_count = 0
-        IDX_DATE, IDX_PIN, IDX_NAME = 1, 3, 4  # Індекси: B=1, D=3, E=4
-
-        for idx, row in enumerate(data):
-            row_number = idx + 2
-            if len(row) <= IDX_NAME:
-                continue
-
-            date_str = row[IDX_DATE].strip()
-            pin = re.sub(r'\s+', '', row[IDX_PIN]).strip()
-            full_name = row[IDX_NAME].strip()
-
-            if not all([date_str, pin, full_name]):
-                print(f"      [SKIP-MISSING] Рядок {row_number}: Дані пропущені.")
-                continue
-
-            internship_end_date = None
-            try:
-                excel_date_number = int(date_str)
-                base_date = datetime(1899, 12, 30).date()
-                internship_end_date = base_date + timedelta(days=excel_date_number)
-            except ValueError:
-                date_formats = ['%d.%m.%Y %H:%M:%S', '%d.%m.%Y', '%Y-%m-%d']
-                for fmt in date_formats:
-                    try:
-                        internship_end_date = datetime.strptime(date_str, fmt).date()
-                        break
-                    except ValueError:
-                        continue
-                if not internship_end_date:
-                    print(f"      [SKIP] Невірний формат дати для ПІН {pin} (Значення: '{date_str}').")
-                    continue
-
-            existing_intern = db.query(Intern).filter(Intern.pin == pin).first()
-            if existing_intern:
-                existing_intern.full_name = full_name
-                existing_intern.internship_end_date = internship_end_date
-            else:
-                new_intern = Intern(pin=pin, full_name=full_name, internship_end_date=internship_end_date)
-                db.add(new_intern)
-            imported_count += 1
+        # API обрізає порожні хвости рядків і діапазонів — вирівнюємо стовпці за довжиною
+        row_count = max(len(date_range), len(pin_name_range))
+        dates = [row[0] if row else '' for row in date_range] + [''] * (row_count - len(date_range))
+        pins = [row[0] if row else '' for row in pin_name_range] + [''] * (row_count - len(pin_name_range))
+        names = [row[1] if len(row) > 1 else '' for row in pin_name_range] + [''] * (row_count - len(pin_name_range))
+
+        valid, rejected = parse_intern_block(dates, pins, names)
+        self._report_rejections(rejected)
+
+        if not valid.empty:
+            # Один пакетний upsert за ПІН замість запиту на кожен рядок
+            stmt = pg_insert(Intern)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Intern.pin],
+                set_={'full_name': stmt.excluded.full_name, 'internship_end_date': stmt.excluded.internship_end_date}
+            )
+            db.execute(stmt, valid[['pin', 'full_name', 'internship_end_date']].to_dict('records'))
+        imported_count = len(valid)
 
         try:
             db.commit()
-            print(f"      [Importer] Успішно імпортовано/оновлено {imported_count} стажерів.")
+            # ПІБ стажерів могли змінитися — скидаємо кеш реєстрацій
+            invalidate_registration_cache()
+            logger.info(f"[Importer] Успішно імпортовано/оновлено {imported_count} стажерів.")
         except IntegrityError as e:
             db.rollback()
             raise ImportError(f"Помилка цілісності БД при імпорті стажерів: {e}")
 
+    def _report_rejections(self, rejected: pd.DataFrame):
+        """Логує підсумок відхилених рядків і зберігає повний звіт у CSV поруч з експортами."""
+        if rejected.empty:
+            return
+        for reason, count in rejected['reason'].value_counts().items():
+            logger.info(f"[SKIP] {reason}: {count} рядк(ів).")
+        try:
+            filepath = os.path.join(
+                settings.EXPORT_DIR, f"intern_import_rejections_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+            rejected.to_csv(filepath, index=False, encoding='utf-8-sig')
+            logger.info(f"[Importer] Звіт про {len(rejected)} відхилених рядків збережено у {filepath}")
+        except Exception as e:
+            logger.warning(f"[Importer] Не вдалося зберегти звіт про відхилені рядки: {e}")
+
     def run_import(self):
         """Основна функція для виконання імпорту."""
         for db in get_db():
             try:
                 self.import_interns(db)
                 # Тут можна додати виклик імпорту питань, якщо потрібно
-                print("   [Importer] ✅ Імпорт даних з Google Sheets завершено успішно.")
+                logger.info("[Importer] ✅ Імпорт даних з Google Sheets завершено успішно.")
             except ImportError as e:
-                print(f"   [Importer] ❌ Критична помилка імпорту: {e}")
+                logger.error(f"[Importer] ❌ Критична помилка імпорту: {e}")
                 raise
             except Exception as e:
-                print(f"   [Importer] ❌ Невідома помилка під час імпорту: {e}")
+                logger.error(f"[Importer] ❌ Невідома помилка під час імпорту: {e}")
                 raise
 
 
@@ -156,9 +202,6 @@ def import_interns_data(SessionLocal: Callable):
     except ImportError as e:
         raise
     except Exception as e:
-        # ❗️❗️❗️ ОСЬ ГОЛОВНА ЗМІНА ДЛЯ ДІАГНОСТИКИ ❗️❗️❗️
-        # Цей код надрукує повний звіт про помилку в консоль.
-        print("\n--- ДЕТАЛЬНИЙ ЗВІТ ПРО ПОМИЛКУ ---")
-        traceback.print_exc()
-        print("---------------------------------\n")
+        # Повний звіт про помилку (з traceback) потрапляє в лог
+        logger.exception("[Importer] ДЕТАЛЬНИЙ ЗВІТ ПРО ПОМИЛКУ")
         raise ImportError(f"Невідома помилка під час повного імпорту: {e}")
\ No newline at end of file
@@ -0,0 +1,79 @@
+import io
+import logging
+import os
+import sys
+
+# Pillow — опційна залежність: без неї зображення зберігаються як є
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+# Telegram стискає фото до 1280 px по довшій стороні — більше надсилати немає сенсу
+TELEGRAM_PHOTO_MAX_SIDE = 1280
+JPEG_QUALITY = 85
+NORMALIZED_EXTENSION = 'jpg'
+
+
+def normalize_image(data: bytes) -> bytes | None:
+    """
+    Готує зображення для send_photo: враховує EXIF-орієнтацію, зменшує до
+    TELEGRAM_PHOTO_MAX_SIDE, прибирає прозорість і метадані, стискає в JPEG.
+    Повертає нові байти або None, якщо Pillow недоступний чи файл не є зображенням.
+    """
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((TELEGRAM_PHOTO_MAX_SIDE, TELEGRAM_PHOTO_MAX_SIDE), Image.LANCZOS)
+
+            if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+                # JPEG не має альфа-каналу — накладаємо на білий фон
+                rgba = img.convert('RGBA')
+                background = Image.new('RGB', rgba.size, (255, 255, 255))
+                background.paste(rgba, mask=rgba.getchannel('A'))
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            out = io.BytesIO()
+            # Нове зображення зберігається без EXIF/ICC — метадані відкидаються
+            img.save(out, format='JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            return out.getvalue()
+    except Exception as e:
+        logger.warning(f"[Image] Не вдалося нормалізувати зображення: {e}")
+        return None
+
+
+def benchmark_directory(path: str):
+    """Порівнює розмір файлів у директорії до і після нормалізації (файли не змінюються)."""
+    total_before, total_after, count = 0, 0, 0
+    for name in sorted(os.listdir(path)):
+        filepath = os.path.join(path, name)
+        if not os.path.isfile(filepath):
+            continue
+        with open(filepath, 'rb') as f:
+            data = f.read()
+        normalized = normalize_image(data)
+        if normalized is None:
+            continue
+        count += 1
+        total_before += len(data)
+        total_after += min(len(normalized), len(data))
+        print(f"{name}: {len(data):>10} -> {len(normalized):>10} байт")
+
+    if count:
+        saved = total_before - total_after
+        print(f"\nФайлів: {count}. Було {total_before} байт, стало {total_after} байт. "
+              f"Заощаджено {saved} байт ({saved / total_before:.1%}).")
+    else:
+        print("Зображень для порівняння не знайдено.")
+
+
+if __name__ == '__main__':
+    # Бенчмарк: python -m src.utils.image_pipeline data/question_photos
+    benchmark_directory(sys.argv[1] if len(sys.argv) > 1 else 'data/question_photos')
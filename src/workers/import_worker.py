@@ -0,0 +1,61 @@
+"""
+Точки входу для імпорту в окремому процесі.
+
+Бот запускає ці функції в пулі процесів (див. loader.run_in_import_pool), щоб парсинг
+великого JSON з Google Docs та запис тисяч рядків не конкурували за GIL з хендлерами.
+Модуль також можна запускати окремо: python -m src.workers.import_worker interns|questions|analysis|retention
+"""
+import logging
+import sys
+
+from ..core.config import settings
+from ..core.logger import setup_logging
+from ..database.session import SessionLocal, read_session
+from ..services.analytics_service import ItemAnalysisService
+from ..services.retention_service import RetentionService
+from ..utils.google_doc_importer import GoogleDocsImporter
+from ..utils.google_sheet_importer import import_interns_data
+
+logger = logging.getLogger(__name__)
+
+
+def run_intern_import():
+    """Імпорт стажерів з Google Sheets."""
+    setup_logging()
+    import_interns_data(SessionLocal)
+
+
+def run_question_import():
+    """Імпорт питань з Google Docs (нова версія банку)."""
+    setup_logging()
+    with SessionLocal() as db:
+        GoogleDocsImporter().import_questions(db)
+
+
+def run_item_analysis():
+    """Пакетний психометричний аналіз питань."""
+    setup_logging()
+    with SessionLocal() as db, read_session() as read_db:
+        ItemAnalysisService(db, read_db).run()
+
+
+def run_retention():
+    """Архівація старих завершених сесій."""
+    setup_logging()
+    with SessionLocal() as db:
+        RetentionService(db).archive_old_sessions(settings.RETENTION_DAYS, settings.RETENTION_BATCH_SIZE)
+
+
+JOBS = {
+    'interns': run_intern_import,
+    'questions': run_question_import,
+    'analysis': run_item_analysis,
+    'retention': run_retention,
+}
+
+
+if __name__ == '__main__':
+    job_name = sys.argv[1] if len(sys.argv) > 1 else ''
+    if job_name not in JOBS:
+        sys.exit(f"Використання: python -m src.workers.import_worker {'|'.join(JOBS)}")
+    JOBS[job_name]()
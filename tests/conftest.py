@@ -0,0 +1,8 @@
+import os
+
+# Мінімальна конфігурація, щоб імпортувати модулі бота без .env (мережа й БД у тестах не використовуються)
+os.environ.setdefault('BOT_TOKEN', '123456:TEST')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('GOOGLE_CREDENTIALS_JSON', '{}')
+os.environ.setdefault('INTERN_SHEET_ID', 'test')
+os.environ.setdefault('QUESTION_DOC_ID', 'test')
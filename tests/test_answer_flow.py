@@ -0,0 +1,103 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from src.core.states import TestingStates
+from src.database import models
+from src.handlers import testing
+
+USER_ID = 42
+
+
+class FakeMessage:
+    """Повідомлення з питанням: запам'ятовує текст і клавіатуру після кожного редагування."""
+
+    def __init__(self, text, reply_markup):
+        self.text = text
+        self.caption = None
+        self.photo = None
+        self.reply_markup = reply_markup
+        self.edits = 0
+
+    async def edit_text(self, text, reply_markup=None, **kwargs):
+        self.text = text
+        self.reply_markup = reply_markup
+        self.edits += 1
+
+    async def answer(self, text, **kwargs):
+        pass
+
+
+class FakeCallback:
+    def __init__(self, message, data):
+        self.message = message
+        self.data = data
+        self.from_user = SimpleNamespace(id=USER_ID)
+        self.answers = []
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+
+def _question(question_id):
+    options = [SimpleNamespace(id=question_id * 10 + i, text=f"Варіант {i}", is_correct=i == 0) for i in range(3)]
+    return SimpleNamespace(id=question_id, text=f"Питання {question_id}", photo_url=None, options=options)
+
+
+def _fake_db(questions):
+    session = SimpleNamespace(id=1, score=0, max_score=len(questions), is_completed=False)
+    options = {o.id: o for q in questions.values() for o in q.options}
+
+    def query(model):
+        chain = MagicMock()
+        if model is models.TestSession:
+            chain.filter.return_value.first.return_value = session
+        elif model is models.AnswerOption:
+            # Тест завжди відповідає першим варіантом поточного питання
+            chain.filter.return_value.first.side_effect = lambda: options[10]
+        elif model is models.Question:
+            chain.filter.return_value.first.side_effect = lambda: questions[2]
+        return chain
+
+    db = MagicMock()
+    db.query.side_effect = query
+    return db
+
+
+def test_double_click_keeps_next_question_keyboard_in_edit_in_place_mode(monkeypatch):
+    questions = {1: _question(1), 2: _question(2)}
+    db = _fake_db(questions)
+    monkeypatch.setattr(testing.settings, 'QUESTION_FLOW_EDIT_IN_PLACE', True)
+    monkeypatch.setattr(testing, 'get_db', lambda: iter([db]))
+    monkeypatch.setattr(testing, 'record_answer', lambda *args: None)
+    monkeypatch.setattr(testing, 'QuestionStatsService', MagicMock())
+
+    async def scenario():
+        state = FSMContext(storage=MemoryStorage(), key=StorageKey(bot_id=1, chat_id=USER_ID, user_id=USER_ID))
+        await state.set_state(TestingStates.in_test)
+        await state.set_data({'session_id': 1, 'questions_list': [1, 2], 'current_q_index': 0})
+
+        service = testing.TestingService(db, MagicMock())
+        first = service.render_question(questions[1], 1)
+        message = FakeMessage(first['text'], first['keyboard'])
+
+        # Перше натискання: повідомлення стає питанням 2
+        await testing.handle_answer(FakeCallback(message, "1:10"), state, MagicMock())
+        next_text, next_keyboard = message.text, message.reply_markup
+        assert next_keyboard.inline_keyboard[0][0].callback_data.startswith("2:")
+
+        # Повторне натискання тієї ж кнопки (черга дублікатів) — повідомлення не чіпаємо
+        duplicate = FakeCallback(message, "1:10")
+        await testing.handle_answer(duplicate, state, MagicMock())
+
+        assert message.edits == 1
+        assert message.text == next_text
+        assert message.reply_markup is next_keyboard
+        assert "повторне натискання" in duplicate.answers[0]
+        assert (await state.get_data())['current_q_index'] == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,43 @@
+import asyncio
+import functools
+import os
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from src.core import loader
+
+
+def _crash_once(marker: str) -> str:
+    # Перший виклик імітує аварію дочірнього процесу (OOM kill, segfault), другий — успіх
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return 'ok'
+
+
+def _always_crash():
+    os._exit(1)
+
+
+def _ok():
+    return 'ok'
+
+
+def test_broken_pool_is_rebuilt_and_job_retried(tmp_path):
+    try:
+        job = functools.partial(_crash_once, str(tmp_path / 'crashed'))
+        job.__name__ = '_crash_once'
+        assert asyncio.run(loader.run_in_import_pool(job)) == 'ok'
+    finally:
+        loader.shutdown_import_pool()
+
+
+def test_repeated_crash_surfaces_error_and_next_job_runs():
+    try:
+        with pytest.raises(BrokenProcessPool):
+            asyncio.run(loader.run_in_import_pool(_always_crash))
+        # Наступне завдання отримує робочий пул, а не BrokenProcessPool
+        assert asyncio.run(loader.run_in_import_pool(_ok)) == 'ok'
+    finally:
+        loader.shutdown_import_pool()
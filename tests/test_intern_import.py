@@ -0,0 +1,14 @@
+from src.utils.google_sheet_importer import parse_intern_block
+
+
+def test_duplicate_pins_are_detected_case_insensitively():
+    valid, rejected = parse_intern_block(
+        ['01.01.2025', '02.01.2025', '03.01.2025'],
+        ['AB12', 'ab12', 'CD34'],
+        ['Перший', 'Другий', 'Третій'],
+    )
+
+    # Діє нижчий рядок, вищий відхиляється як дублікат
+    assert valid['pin'].tolist() == ['ab12', 'CD34']
+    assert rejected['row_number'].tolist() == [2]
+    assert rejected['reason'].str.startswith('дублікат ПІН').all()
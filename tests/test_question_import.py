@@ -0,0 +1,58 @@
+from unittest.mock import MagicMock
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import QuestionBank, Question, AnswerOption
+from src.utils import google_doc_importer
+from src.utils.google_doc_importer import GoogleDocsImporter
+
+GREEN = {'foregroundColor': {'color': {'rgbColor': {'red': 0.1, 'green': 0.6, 'blue': 0.1}}}}
+
+
+def _paragraph(text, style=None):
+    text_run = {'content': text + "\n"}
+    if style:
+        text_run['textStyle'] = style
+    return {'paragraph': {'elements': [{'textRun': text_run}]}}
+
+
+def _document(*questions):
+    content = []
+    for i, question in enumerate(questions, start=1):
+        content.append(_paragraph(f"{i}. {question}:"))
+        content.append(_paragraph("- Правильно", GREEN))
+        content.append(_paragraph("- Неправильно"))
+    return {'body': {'content': content}, 'inlineObjects': {}}
+
+
+def _importer(document):
+    # Конструктор автентифікується в Google — у тесті підміняємо лише клієнт Docs
+    importer = GoogleDocsImporter.__new__(GoogleDocsImporter)
+    importer.photo_bytes_original = importer.photo_bytes_final = 0
+    importer.docs_service = MagicMock()
+    importer.docs_service.documents.return_value.get.return_value.execute.return_value = document
+    return importer
+
+
+def test_unchanged_document_keeps_active_bank(monkeypatch):
+    engine = create_engine('sqlite://')
+    for table in (QuestionBank.__table__, Question.__table__, AnswerOption.__table__):
+        table.create(engine)
+    db = sessionmaker(bind=engine)()
+    monkeypatch.setattr(google_doc_importer, 'write_snapshot', lambda questions: None)
+    monkeypatch.setattr(GoogleDocsImporter, '_prune_unused_banks', lambda self, db: None)
+
+    document = _document("Перше питання", "Друге питання")
+    _importer(document).import_questions(db)
+    first_ids = sorted(db.scalars(select(Question.id)).all())
+
+    # Щоденний імпорт того самого документа не створює нову версію і не змінює ID питань
+    _importer(document).import_questions(db)
+    assert db.query(QuestionBank).count() == 1
+    assert sorted(db.scalars(select(Question.id)).all()) == first_ids
+
+    # Змінений документ — нова активна версія
+    _importer(_document("Перше питання", "Нове питання")).import_questions(db)
+    banks = db.query(QuestionBank).order_by(QuestionBank.id).all()
+    assert [bank.is_active for bank in banks] == [False, True]
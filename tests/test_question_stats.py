@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+
+from src.database.models import QuestionBank, Question, AnswerOption, QuestionStat, AnswerOptionStat
+from src.services.stats_service import QuestionStatsService
+
+
+def _add_bank(db, text):
+    bank = QuestionBank(is_active=False, question_count=1)
+    question = Question(text=text, bank=bank, options=[
+        AnswerOption(text="Правильно", is_correct=True), AnswerOption(text="Неправильно", is_correct=False),
+    ])
+    db.add(question)
+    db.flush()
+    db.execute(update(QuestionBank).values(is_active=(QuestionBank.id == bank.id)))
+    return question
+
+
+def test_stats_cover_only_active_bank_version():
+    engine = create_engine('sqlite://')
+    for table in (QuestionBank.__table__, Question.__table__, AnswerOption.__table__,
+                  QuestionStat.__table__, AnswerOptionStat.__table__):
+        table.create(engine)
+    db = sessionmaker(bind=engine)()
+    service = QuestionStatsService(db)
+
+    old = _add_bank(db, "Питання")
+    for option in (old.options[0], old.options[1], old.options[1]):
+        service.record_answer(old.id, option.id, option.is_correct)
+
+    # Новий імпорт: те саме питання в новій версії банку з новими ID
+    new = _add_bank(db, "Питання")
+    service.record_answer(new.id, new.options[0].id, True)
+    db.commit()
+
+    stats = service.get_question_stats()
+    assert [s['question_id'] for s in stats] == [new.id]
+    assert stats[0]['times_asked'] == 1
+    assert [o['times_picked'] for o in stats[0]['option_picks']] == [1]